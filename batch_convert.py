@@ -0,0 +1,189 @@
+import logging
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+
+from final_xml_to_geojsonn import (
+    OBJECT_TAG, NetworkObject, NetworkStore, iter_features, iter_network_objects,
+    iter_object_elements, parse_voltage_classes, validate_network,
+)
+from geojson_writer import open_geojson_writer
+
+# Пакетная конвертация нескольких выгрузок. Большая выгрузка делится на диапазоны байтов
+# по границам объектов (несколько seek, без отдельного прохода по файлу), файлы и диапазоны
+# разбираются параллельно в пуле процессов, а сборка сети, валидация и запись выполняются
+# один раз над объединёнными объектами — поэтому пролеты и участки, чьи опоры лежат
+# в другом файле или диапазоне, разрешаются так же, как при одной выгрузке.
+
+XML_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<V8Exch:_1CV8DtUD xmlns:V8Exch="http://www.1c.ru/V8/1CV8DtUD/">\n\t<V8Exch:Data>\n')
+XML_FOOTER = '\t</V8Exch:Data>\n</V8Exch:_1CV8DtUD>\n'
+NO_FILIAL = 'Без_филиала'
+CHUNK_BYTES = 32 * 2 ** 20  # Примерный размер диапазона выгрузки для одного процесса
+SEARCH_WINDOW = 2 ** 16  # Сколько байтов читать за раз при поиске границы объекта
+OBJECT_END = f'</{OBJECT_TAG}>'.encode('utf-8')
+
+# Граница объекта: позиция сразу после первого закрывающего тега объекта не раньше
+# offset (None, если до конца файла его нет)
+def find_object_end(f, offset):
+    f.seek(offset)
+    buffer = b''
+    while True:
+        data = f.read(SEARCH_WINDOW)
+        if not data:
+            return None
+        buffer += data
+        found = buffer.find(OBJECT_END)
+        if found >= 0:
+            return offset + found + len(OBJECT_END)
+        # Хвост окна может оказаться началом тега — он остаётся для следующего чтения
+        keep = len(OBJECT_END) - 1
+        offset += len(buffer) - keep
+        buffer = buffer[-keep:]
+
+# Деление выгрузки на диапазоны байтов примерно по chunk_size. Объекты в выгрузке 1С
+# лежат подряд внутри Data, поэтому граница ставится после закрывающего тега объекта.
+# Каждая часть — список кусков (начало, конец): заголовок файла до первого объекта,
+# свой диапазон объектов и закрывающие теги после последнего объекта. Для маленького
+# файла или файла без объектов — None (читается целиком)
+def split_ranges(input_file, chunk_size=CHUNK_BYTES):
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not chunk_size or size <= chunk_size:
+            return [None]
+        head = f.read(SEARCH_WINDOW * 16)
+        first = head.find(f'<{OBJECT_TAG}'.encode('utf-8'))
+        f.seek(max(0, size - SEARCH_WINDOW * 16))
+        tail = f.read()
+        last = tail.rfind(OBJECT_END)
+        if first < 0 or last < 0:
+            return [None]
+        last += size - len(tail) + len(OBJECT_END)
+        bounds = [first]
+        while True:
+            end = find_object_end(f, bounds[-1] + chunk_size)
+            if end is None or end >= last:
+                break
+            bounds.append(end)
+        bounds.append(last)
+    return [[(0, first), (start, end), (last, size)] for start, end in zip(bounds, bounds[1:])]
+
+# Файл, из которого читаются только заданные куски (начало, конец) подряд — для iterparse
+class RangeReader:
+    def __init__(self, f, pieces):
+        self.file = f
+        self.pieces = deque(pieces)
+        self.left = 0
+
+    def read(self, size=-1):
+        while self.left <= 0:
+            if not self.pieces:
+                return b''
+            start, end = self.pieces.popleft()
+            self.file.seek(start)
+            self.left = end - start
+        data = self.file.read(self.left if size < 0 else min(size, self.left))
+        self.left = self.left - len(data) if data else 0
+        return data
+
+# Разбор одного файла (или его диапазона pieces, см. split_ranges) в процессе пула:
+# записи возвращаются кортежами полей, чтобы передача между процессами была компактной
+def parse_export(input_file, pieces=None):
+    name = input_file if pieces is None else f"{input_file} [{pieces[1][0]}:{pieces[1][1]}]"
+    try:
+        with open(input_file, 'rb') as f:
+            source = f if pieces is None else RangeReader(f, pieces)
+            objects = [tuple(getattr(obj, field) for field in NetworkObject.__slots__)
+                       for obj in iter_network_objects(source)]
+    except FileNotFoundError:
+        logging.error("Файл '%s' не найден.", input_file)
+        return name, None
+    except ET.ParseError:
+        logging.error("Ошибка парсинга '%s'.", name)
+        return name, None
+    return name, objects
+
+# Однопроходное разбиение выгрузки на части по свойству Филиал (например, чтобы
+# отдать каждому филиалу его часть). Возвращает пути частей, упорядоченные по Ref
+# филиала, или None, если выгрузка не прочитана (недописанные части удаляются)
+def split_export_by_filial(input_file, output_dir):
+    files = {}
+    done = False
+    try:
+        for elem in iter_object_elements(input_file):
+            filial = elem.findtext('Филиал') or NO_FILIAL
+            part = files.get(filial)
+            if part is None:
+                path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_{filial}.xml")
+                part = files[filial] = open(path, 'w', encoding='utf-8')
+                part.write(XML_HEADER)
+            elem.tail = '\n'
+            part.write('\t\t' + ET.tostring(elem, encoding='unicode'))
+        done = True
+    except FileNotFoundError:
+        logging.error("Файл '%s' не найден.", input_file)
+    except ET.ParseError:
+        logging.error("Ошибка парсинга '%s'.", input_file)
+    finally:
+        for part in files.values():
+            if done:
+                part.write(XML_FOOTER)
+            part.close()
+            if not done:
+                os.remove(part.name)
+    if not done:
+        return None
+    logging.info("Выгрузка '%s' разбита на %d частей по филиалам", input_file, len(files))
+    return [files[filial].name for filial in sorted(files)]
+
+# Объекты из результатов разбора по мере их поступления: части, уже переданные в
+# хранилище, освобождаются, и весь пакет не копится в памяти списками кортежей
+def iter_parsed_objects(results):
+    for part, part_objects in results:
+        if part_objects is None:
+            continue
+        logging.info("Спарсено %d объектов из '%s'", len(part_objects), part)
+        for values in part_objects:
+            yield NetworkObject(*values)
+
+# Пакетная конвертация: input_files — список выгрузок; выгрузки больше chunk_size байт
+# разбираются по диапазонам (None — каждая целиком); workers — число процессов
+# (None — по числу ядер)
+def process_many_to_geojson(input_files, voltage_file='Классы_напряжения.xml', output_file='output.geojson',
+                            log_file='missing_coordinates.log', workers=None, chunk_size=CHUNK_BYTES,
+                            output_format='geojson', compact=False, compress=None):
+    # Классы напряжения разбираются один раз на весь пакет
+    voltage_classes = parse_voltage_classes(voltage_file)
+
+    files, pieces = [], []
+    for input_file in input_files:
+        try:
+            ranges = split_ranges(input_file, chunk_size)
+        except FileNotFoundError:
+            logging.error("Файл '%s' не найден.", input_file)
+            continue
+        files.extend([input_file] * len(ranges))
+        pieces.extend(ranges)
+
+    # map сохраняет порядок файлов и диапазонов — объединение детерминировано
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        store = NetworkStore.from_objects(iter_parsed_objects(executor.map(parse_export, files, pieces)))
+    logging.info("Объединено %d объектов из %d частей", store.object_count, len(pieces))
+    logging.info("Найдено %d ЛЭП, %d участков, %d пролетов, %d опор",
+                 len(store.lines), len(store.sections), len(store.spans), len(store.supports))
+
+    # Общие валидация и лог опор без координат по всему пакету
+    validate_network(store, log_file)
+
+    with open_geojson_writer(output_file, output_format, compact, compress) as writer:
+        for feature in iter_features(store, voltage_classes):
+            writer.write(feature)
+    logging.info("GeoJSON записан в '%s' с %d features", output_file, writer.count)
+
+if __name__ == "__main__":
+    # freeze_support нужен для пула процессов в собранном PyInstaller exe
+    freeze_support()
+    process_many_to_geojson(sys.argv[1:] or ['ЛЭП.xml'])
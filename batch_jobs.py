@@ -0,0 +1,212 @@
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from final_xml_to_geojsonn import process_xml_to_geojson
+from run_monitor import RunCancelled, RunMonitor
+
+# Пакетная конвертация: задания выполняются в ограниченном пуле процессов, а логи и
+# прогресс процессы отправляют сообщениями в общую очередь. Владелец очереди (GUI)
+# забирает сообщения пачками из своего потока методом poll(), поэтому рабочие процессы
+# никогда не обращаются к виджетам. Отмена — через Event задания, который RunMonitor
+# проверяет во время конвертации; отменённое или упавшее задание можно повторить.
+
+MAX_WORKERS = max(1, min(2, os.cpu_count() or 1))  # Конвертация требует много памяти — по умолчанию не больше двух
+POLL_BATCH = 500  # Сколько сообщений забирать за один poll()
+
+# Состояния задания
+PENDING = 'ожидает'
+RUNNING = 'выполняется'
+DONE = 'готово'
+FAILED = 'ошибка'
+CANCELLED = 'отменено'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Обработчик logging, который кладёт отформатированные записи в очередь сообщений:
+# ('log', номер задания или None, текст)
+class QueueLogHandler(logging.Handler):
+    def __init__(self, messages, job_id=None):
+        super().__init__()
+        self.messages = messages
+        self.job_id = job_id
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        try:
+            self.messages.put(('log', self.job_id, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+_worker_handler = None
+
+# Инициализация рабочего процесса: весь logging процесса уходит в очередь сообщений
+def init_worker(messages):
+    global _worker_handler
+    _worker_handler = QueueLogHandler(messages)
+    root = logging.getLogger()
+    root.handlers = [_worker_handler]
+    root.setLevel(logging.INFO)
+
+# Выполнение одного задания в рабочем процессе; прогресс отправляется сообщениями
+# ('progress', номер задания, этап, доля 0..1, ETA). Возвращает (состояние, описание)
+def run_job(job_id, input_file, voltage_file, output_file, options, cancel_event):
+    messages = _worker_handler.messages
+    _worker_handler.job_id = job_id
+
+    def on_progress(progress):
+        messages.put(('progress', job_id, progress.stage, progress.fraction, progress.eta))
+
+    monitor = RunMonitor(progress=on_progress, cancel_event=cancel_event)
+    try:
+        logging.info("Запуск: %s -> %s", input_file, output_file)
+        process_xml_to_geojson(input_file, voltage_file, output_file, monitor=monitor, **options)
+    except RunCancelled:
+        logging.info("Конвертация отменена, недописанный файл удалён")
+        return CANCELLED, "Отменено"
+    except Exception as e:
+        logging.exception("Ошибка конвертации %s", input_file)
+        return FAILED, str(e)
+    if 'emit' not in monitor.stats:
+        # Выгрузка не прочитана (нет файла или ошибка XML) — причина уже в логе
+        return FAILED, "Выгрузка не прочитана"
+    return DONE, "Готово"
+
+class Job:
+    __slots__ = ('id', 'input_file', 'voltage_file', 'output_file', 'options', 'status', 'detail',
+                 'stage', 'fraction', 'eta', 'future', 'cancel_event')
+
+    def __init__(self, job_id, input_file, voltage_file, output_file, options):
+        self.id = job_id
+        self.input_file = input_file
+        self.voltage_file = voltage_file
+        self.output_file = output_file
+        self.options = options
+        self.status = PENDING
+        self.detail = ''
+        self.stage = None
+        self.fraction = 0.0
+        self.eta = None
+        self.future = None
+        self.cancel_event = None
+
+# Очередь заданий над ProcessPoolExecutor. Все методы вызываются из одного потока
+# (потока Tk); сообщения процессов применяются к заданиям в poll()
+class JobQueue:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.jobs = {}
+        self.next_id = 1
+        # spawn — одинаково на Windows и Linux и без копии состояния Tk в рабочих процессах
+        self.context = multiprocessing.get_context('spawn')
+        self.messages = self.context.Queue()
+        self.manager = None
+        self.executor = None
+
+    # Новое задание в состоянии PENDING; options — именованные аргументы process_xml_to_geojson
+    def add(self, input_file, voltage_file, output_file, options=None):
+        job = Job(self.next_id, input_file, voltage_file, output_file, dict(options or {}))
+        self.jobs[job.id] = job
+        self.next_id += 1
+        return job
+
+    def _executor(self):
+        if self.executor is None:
+            if self.manager is None:
+                self.manager = self.context.Manager()
+            self.executor = ProcessPoolExecutor(self.max_workers, mp_context=self.context,
+                                                initializer=init_worker, initargs=(self.messages,))
+        return self.executor
+
+    # Отправка задания в пул (лишние ждут свободного процесса в очереди пула)
+    def start(self, job):
+        if job.status not in (PENDING, FAILED, CANCELLED):
+            return False
+        executor = self._executor()
+        job.cancel_event = self.manager.Event()
+        job.status, job.detail, job.stage, job.fraction, job.eta = PENDING, '', None, 0.0, None
+        job.future = executor.submit(run_job, job.id, job.input_file, job.voltage_file, job.output_file,
+                                     job.options, job.cancel_event)
+        return True
+
+    def start_pending(self):
+        return [job for job in self.jobs.values() if job.status == PENDING and job.future is None and self.start(job)]
+
+    # Отмена: задание из очереди пула снимается сразу, выполняющееся — по Event
+    def cancel(self, job):
+        if job.future is None:
+            if job.status == PENDING:
+                job.status, job.detail = CANCELLED, "Отменено"
+            return
+        if job.future.cancel():
+            job.status, job.detail = CANCELLED, "Отменено"
+        elif job.status not in FINISHED:
+            job.cancel_event.set()
+
+    # Повтор отменённого или упавшего задания с теми же параметрами
+    def retry(self, job):
+        return job.status in (FAILED, CANCELLED) and self.start(job)
+
+    def remove(self, job):
+        if job.status in FINISHED or job.future is None:
+            del self.jobs[job.id]
+            return True
+        return False
+
+    # Применение накопившихся сообщений (не больше batch) и завершённых заданий.
+    # Возвращает строки лога для вывода и множество изменившихся заданий
+    def poll(self, batch=POLL_BATCH):
+        lines = []
+        changed = set()
+        for _ in range(batch):
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            kind, job_id = message[0], message[1]
+            job = self.jobs.get(job_id)
+            if kind == 'log':
+                lines.append(message[2] if job is None else f"[{os.path.basename(job.input_file)}] {message[2]}")
+            elif job is not None and job.status in (PENDING, RUNNING):
+                job.status = RUNNING
+                job.stage, job.fraction, job.eta = message[2:]
+                changed.add(job)
+        for job in self.jobs.values():
+            if job.future is None or not job.future.done() or job.status in FINISHED:
+                continue
+            if job.future.cancelled():
+                job.status, job.detail = CANCELLED, "Отменено"
+            else:
+                try:
+                    job.status, job.detail = job.future.result()
+                except BrokenProcessPool as e:
+                    # Процесс пула аварийно завершился — пул пересоздаётся при следующем запуске
+                    job.status, job.detail = FAILED, f"Рабочий процесс завершился аварийно: {e}"
+                    self.executor = None
+                except Exception as e:
+                    job.status, job.detail = FAILED, str(e)
+            if job.status == DONE:
+                job.fraction = 1.0
+            job.eta = None
+            changed.add(job)
+        return lines, changed
+
+    def active(self):
+        return [job for job in self.jobs.values() if job.future is not None and job.status not in FINISHED]
+
+    # Остановка: ожидающие задания снимаются (cancel() отменяет их future — без
+    # cancel_futures, которого нет в Python 3.8), выполняющиеся отменяются по Event,
+    # и пул ждёт, пока они это заметят (Event живёт в менеджере, он закрывается последним)
+    def shutdown(self):
+        for job in self.active():
+            self.cancel(job)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
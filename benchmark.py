@@ -0,0 +1,163 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import lep_to_four_groups
+from final_xml_to_geojsonn import (
+    iter_features, load_network, parse_voltage_classes, process_xml_to_geojson, validate_network,
+)
+from geojson_writer import open_geojson_writer
+from synthetic_export import write_synthetic_export, write_voltage_classes
+
+# Бенчмарк конвертера на синтетических выгрузках: время, пропускная способность
+# и пик памяти (tracemalloc) по этапам. Результаты можно сохранить как базовые
+# и сравнивать с ними следующие прогоны, чтобы замечать регрессии.
+
+DEFAULT_SIZES = (10000, 100000)
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+REGRESSION_THRESHOLD = 1.25  # Во сколько раз медленнее базового прогона считается регрессией
+MIN_COMPARABLE_SECONDS = 0.05  # Более короткие этапы слишком шумные для сравнения
+
+# Замер одного этапа: (результат, запись с временем и приростом пика памяти за этап)
+def measure(stage, objects, func, *args, **kwargs):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:  # Python 3.8: пик сбрасывается только перезапуском трассировки
+            tracemalloc.stop()
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - before if tracing else None
+    return result, {
+        'stage': stage,
+        'seconds': round(elapsed, 4),
+        'objects_per_second': round(objects / elapsed) if elapsed else None,
+        'peak_mb': round(peak / 2 ** 20, 2) if tracing else None,
+    }
+
+# Запись features в файл (этап emit + write конвертера)
+def write_features(store, voltage_classes, output_file):
+    with open_geojson_writer(output_file) as writer:
+        for feature in iter_features(store, voltage_classes):
+            writer.write(feature)
+    return writer.count
+
+# Прогон всех этапов конвертера и разделителя на готовой выгрузке
+def run_stages(input_file, voltage_file, work_dir, objects):
+    output_file = os.path.join(work_dir, 'output.geojson')
+    log_file = os.path.join(work_dir, 'missing_coordinates.log')
+    stages = []
+    voltage_classes, record = measure('voltage_classes', objects, parse_voltage_classes, voltage_file)
+    stages.append(record)
+    store, record = measure('parse', objects, load_network, input_file)
+    stages.append(record)
+    _, record = measure('validate', objects, validate_network, store, log_file)
+    stages.append(record)
+    _, record = measure('emit_write', objects, write_features, store, voltage_classes, output_file)
+    stages.append(record)
+    del store
+    _, record = measure('process_xml_to_geojson', objects, process_xml_to_geojson,
+                        input_file, voltage_file, output_file, log_file)
+    stages.append(record)
+
+    _, record = measure('lep_to_four_groups', objects, lep_to_four_groups.split_xml_file,
+                        input_file, output_dir=work_dir)
+    stages.append(record)
+    return stages
+
+# Прогон на выгрузке одного размера. Время меряется без tracemalloc (он замедляет
+# этапы в разы); при memory=True память меряется отдельным вторым проходом
+def run_case(size, work_dir, seed=1, missing_share=0.05, memory=False):
+    input_file = os.path.join(work_dir, f'synthetic_{size}.xml')
+    voltage_file = os.path.join(work_dir, 'Классы_напряжения.xml')
+    counts = write_synthetic_export(input_file, size, missing_share=missing_share, seed=seed)
+    write_voltage_classes(voltage_file)
+    objects = sum(counts.values())
+
+    stages = run_stages(input_file, voltage_file, work_dir, objects)
+    if memory:
+        tracemalloc.start()
+        try:
+            traced = run_stages(input_file, voltage_file, work_dir, objects)
+        finally:
+            tracemalloc.stop()
+        for stage, traced_stage in zip(stages, traced):
+            stage['peak_mb'] = traced_stage['peak_mb']
+
+    return {'size': size, 'objects': objects, 'counts': counts,
+            'input_mb': round(os.path.getsize(input_file) / 2 ** 20, 2), 'stages': stages}
+
+# Сравнение с базовыми результатами: список (размер, этап, отношение времени)
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    base = {(case['size'], stage['stage']): stage['seconds'] for case in baseline['cases'] for stage in case['stages']}
+    regressions = []
+    for case in results['cases']:
+        for stage in case['stages']:
+            reference = base.get((case['size'], stage['stage']))
+            if reference and reference >= MIN_COMPARABLE_SECONDS and stage['seconds'] / reference > threshold:
+                regressions.append((case['size'], stage['stage'], stage['seconds'] / reference))
+    return regressions
+
+def print_report(results, baseline=None):
+    base = {}
+    if baseline:
+        base = {(case['size'], stage['stage']): stage['seconds'] for case in baseline['cases'] for stage in case['stages']}
+    for case in results['cases']:
+        print(f"\n{case['objects']} объектов ({case['input_mb']} МБ XML)")
+        print(f"{'этап':<24}{'сек':>10}{'объектов/с':>14}{'пик МБ':>10}{'к базе':>10}")
+        for stage in case['stages']:
+            reference = base.get((case['size'], stage['stage']))
+            ratio = f"{stage['seconds'] / reference:.2f}x" if reference else '-'
+            peak = f"{stage['peak_mb']:.1f}" if stage['peak_mb'] is not None else '-'
+            print(f"{stage['stage']:<24}{stage['seconds']:>10.3f}{stage['objects_per_second'] or 0:>14}"
+                  f"{peak:>10}{ratio:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвертера ЛЭП XML -> GeoJSON на синтетических выгрузках")
+    parser.add_argument('sizes', nargs='*', type=int, default=list(DEFAULT_SIZES), help="Размеры выгрузок в объектах")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Файл базовых результатов")
+    parser.add_argument('--save-baseline', action='store_true', help="Сохранить результаты как базовые")
+    parser.add_argument('--output', help="Сохранить результаты прогона в JSON")
+    parser.add_argument('--missing-share', type=float, default=0.05, help="Доля опор без координат")
+    parser.add_argument('--work-dir', help="Каталог для выгрузок (по умолчанию временный)")
+    parser.add_argument('--memory', action='store_true',
+                        help="Дополнительно измерить пик памяти по этапам отдельным проходом (tracemalloc)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {'python': platform.python_version(), 'machine': platform.machine(), 'cases': []}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        for size in args.sizes:
+            results['cases'].append(run_case(size, work_dir, missing_share=args.missing_share, memory=args.memory))
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовые результаты сохранены в '{args.baseline}'")
+    elif baseline:
+        regressions = find_regressions(results, baseline)
+        for size, stage, ratio in regressions:
+            print(f"РЕГРЕССИЯ: {stage} на {size} объектах медленнее базы в {ratio:.2f} раза")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,306 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from final_xml_to_geojsonn import iter_features, load_network, parse_voltage_classes, validate_network
+from geojson_writer import dumps_compact, resolve_backend
+from vector_tiles import TileGridIndex, geometry_parts, lonlat_to_tile
+
+# Локальный HTTP-сервер features: результат конвертера загружается (или строится из XML)
+# в память один раз, каждая feature заранее сериализуется, а запросы по bbox, Ref, типу,
+# напряжению и связям отвечают склейкой готовых фрагментов. Ответы хранятся в LRU-кэше
+# вместе с gzip-версией и ETag, поэтому повторный запрос стоит одного поиска в словаре,
+# а при совпадении If-None-Match клиент получает 304 без тела. Только стандартная библиотека.
+
+INDEX_ZOOM = 12  # Зум сеточного индекса (ячейка ~10 км)
+CACHE_SIZE = 256  # Сколько ответов держать в LRU-кэше
+GZIP_LEVEL = 6
+MIN_GZIP_SIZE = 1024  # Меньшие ответы не сжимаются
+
+COLLECTION_HEAD = b'{"type":"FeatureCollection","features":['
+COLLECTION_TAIL = b']}'
+
+# Готовый ответ: тело, его gzip-версия и ETag
+class CachedResponse:
+    __slots__ = ('body', 'gzipped', 'etag', 'status', 'content_type')
+
+    def __init__(self, body, status=200, content_type='application/geo+json'):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.gzipped = gzip.compress(body, GZIP_LEVEL) if len(body) >= MIN_GZIP_SIZE else None
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+# Индекс features: сериализованные фрагменты, bbox каждой feature, сеточный
+# пространственный индекс и словари по Ref и типу
+class FeatureIndex:
+    def __init__(self, features):
+        self.fragments = []
+        self.types = []
+        self.voltages = []
+        self.relations = []
+        self.bboxes = []
+        self.by_ref = {}
+        self.by_type = {}
+        self.grid = TileGridIndex(INDEX_ZOOM)
+        backend = resolve_backend()
+        for i, feature in enumerate(features):
+            properties = feature.get('properties') or {}
+            ref = properties.get('ref')
+            self.fragments.append(dumps_compact(feature, backend).encode('utf-8'))
+            self.types.append(properties.get('type'))
+            self.voltages.append(properties.get('voltage'))
+            self.relations.append([r.get('objectId') for r in (feature.get('system') or {}).get('relations', ())])
+            self.by_ref.setdefault(ref, []).append(i)
+            self.by_type.setdefault(properties.get('type'), []).append(i)
+            geometry = feature.get('geometry')
+            bbox = None
+            if geometry is not None:
+                points = [point for part in geometry_parts(geometry) for point in part]
+                if points:
+                    lons = [p[0] for p in points]
+                    lats = [p[1] for p in points]
+                    bbox = (min(lons), min(lats), max(lons), max(lats))
+                    self.grid.insert(i, geometry)
+            self.bboxes.append(bbox)
+
+    def __len__(self):
+        return len(self.fragments)
+
+    # Номера features, чей bbox пересекается с bbox запроса
+    def query_bbox(self, bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y0 = lonlat_to_tile(min_lon, max_lat, INDEX_ZOOM)
+        x1, y1 = lonlat_to_tile(max_lon, min_lat, INDEX_ZOOM)
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        cells = self.grid.cells
+        candidates = set()
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            # Большой bbox: дешевле пройти по непустым ячейкам
+            for (x, y), items in cells.items():
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    candidates.update(items)
+        else:
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    candidates.update(cells.get((x, y), ()))
+        bboxes = self.bboxes
+        return [i for i in sorted(candidates)
+                if bboxes[i][0] <= max_lon and bboxes[i][2] >= min_lon
+                and bboxes[i][1] <= max_lat and bboxes[i][3] >= min_lat]
+
+    # Отбор по типам и диапазону напряжения (None — без условия)
+    def filter(self, ids, types=None, min_voltage=None, max_voltage=None):
+        result = []
+        for i in ids:
+            if types is not None and self.types[i] not in types:
+                continue
+            voltage = self.voltages[i]
+            if min_voltage is not None and (voltage is None or voltage < min_voltage):
+                continue
+            if max_voltage is not None and (voltage is None or voltage > max_voltage):
+                continue
+            result.append(i)
+        return result
+
+    # Features с заданным Ref и всё, на что они ссылаются через relations
+    # (ЛЭП -> участки -> пролеты -> опоры), не глубже depth уровней
+    def expand(self, ref, depth=None):
+        seen = set(self.by_ref.get(ref, ()))
+        frontier = list(seen)
+        level = 0
+        while frontier and (depth is None or level < depth):
+            next_frontier = []
+            for i in frontier:
+                for related in self.relations[i]:
+                    for j in self.by_ref.get(related, ()):
+                        if j not in seen:
+                            seen.add(j)
+                            next_frontier.append(j)
+            frontier = next_frontier
+            level += 1
+        return sorted(seen)
+
+    # FeatureCollection из готовых фрагментов
+    def collection(self, ids):
+        return COLLECTION_HEAD + b','.join(self.fragments[i] for i in ids) + COLLECTION_TAIL
+
+    # Сводка для корневого запроса
+    def summary(self):
+        return {'features': len(self), 'types': {t: len(ids) for t, ids in self.by_type.items()}}
+
+# LRU-кэш ответов; доступ из потоков сервера под блокировкой
+class ResponseCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            response = self.items.get(key)
+            if response is not None:
+                self.items.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        with self.lock:
+            self.items[key] = response
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+class BadRequest(Exception):
+    pass
+
+def parse_bbox(value):
+    try:
+        bbox = tuple(float(v) for v in value.split(','))
+    except ValueError:
+        raise BadRequest("bbox: ожидаются числа min_lon,min_lat,max_lon,max_lat")
+    if len(bbox) != 4:
+        raise BadRequest("bbox: ожидаются четыре числа min_lon,min_lat,max_lon,max_lat")
+    if not all(math.isfinite(v) for v in bbox):
+        raise BadRequest("bbox: ожидаются конечные числа")
+    if not all(-180 <= v <= 180 for v in bbox[0::2]) or not all(-90 <= v <= 90 for v in bbox[1::2]):
+        raise BadRequest("bbox: долгота должна быть в [-180, 180], широта — в [-90, 90]")
+    if bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise BadRequest("bbox: минимум больше максимума")
+    return bbox
+
+def parse_number(query, name, cast=float):
+    values = query.get(name)
+    if not values:
+        return None
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise BadRequest(f"{name}: ожидается число")
+
+# Ответ на запрос (path, query) без учёта кэша:
+#   /                               — сводка по индексу
+#   /features?bbox=&type=&min_voltage=&max_voltage=&limit=
+#   /features/<ref>                 — features с этим Ref
+#   /features/<ref>/relations?depth= — feature и связанные с ней объекты
+def build_response(index, path, query):
+    parts = [unquote(p) for p in path.strip('/').split('/') if p]
+    if not parts:
+        return CachedResponse(json.dumps(index.summary(), ensure_ascii=False).encode('utf-8'),
+                              content_type='application/json')
+    if parts[0] != 'features' or len(parts) > 3 or (len(parts) == 3 and parts[2] != 'relations'):
+        return CachedResponse(b'{"error":"not found"}', 404, 'application/json')
+
+    if len(parts) == 1:
+        ids = index.query_bbox(parse_bbox(query['bbox'][0])) if 'bbox' in query else range(len(index))
+    elif len(parts) == 2:
+        ids = index.by_ref.get(parts[1], [])
+    else:
+        ids = index.expand(parts[1], parse_number(query, 'depth', int))
+    if len(parts) > 1 and not ids:
+        return CachedResponse(b'{"error":"not found"}', 404, 'application/json')
+
+    types = set(','.join(query['type']).split(',')) if 'type' in query else None
+    ids = index.filter(ids, types, parse_number(query, 'min_voltage'), parse_number(query, 'max_voltage'))
+    limit = parse_number(query, 'limit', int)
+    if limit is not None:
+        ids = ids[:limit]
+    return CachedResponse(index.collection(ids))
+
+# Обработчик запросов: кэш, ETag/If-None-Match и gzip по Accept-Encoding
+class FeatureRequestHandler(BaseHTTPRequestHandler):
+    index = None
+    cache = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        key = (url.path, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+        response = self.cache.get(key)
+        if response is None:
+            try:
+                response = build_response(self.index, url.path, query)
+            except BadRequest as e:
+                response = CachedResponse(json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8'), 400,
+                                          'application/json')
+            self.cache.put(key, response)
+
+        if response.status == 200 and self.headers.get('If-None-Match') == response.etag:
+            self.send_response(304)
+            self.send_header('ETag', response.etag)
+            self.end_headers()
+            return
+
+        body = response.body
+        gzip_accepted = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        self.send_response(response.status)
+        self.send_header('Content-Type', response.content_type + '; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', response.etag)
+        if gzip_accepted and response.gzipped is not None:
+            body = response.gzipped
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+# Индекс по готовому GeoJSON (FeatureCollection)
+def load_geojson_index(geojson_file):
+    with open(geojson_file, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    return FeatureIndex(features)
+
+# Индекс, построенный прямо из выгрузки, без записи GeoJSON на диск
+def load_xml_index(input_file, voltage_file='Классы_напряжения.xml', log_file='missing_coordinates.log'):
+    voltage_classes = parse_voltage_classes(voltage_file)
+    store = load_network(input_file)
+    if store is None:
+        return None
+    validate_network(store, log_file)
+    return FeatureIndex(iter_features(store, voltage_classes))
+
+# Сервер с обработчиком, привязанным к индексу и кэшу
+def make_server(index, host='127.0.0.1', port=8000, cache_size=CACHE_SIZE):
+    cache = ResponseCache(cache_size)
+    # Полная коллекция запрашивается чаще всего — она сериализуется и сжимается заранее
+    cache.put(('/features', ()), build_response(index, '/features', {}))
+    handler = type('BoundFeatureRequestHandler', (FeatureRequestHandler,), {'index': index, 'cache': cache})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер GeoJSON features ЛЭП")
+    parser.add_argument('source', nargs='?', default='output.geojson', help="GeoJSON конвертера или XML выгрузки")
+    parser.add_argument('--voltage', default='Классы_напряжения.xml', help="Классы напряжения (для XML)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="Размер LRU-кэша ответов")
+    args = parser.parse_args()
+
+    if args.source.lower().endswith('.xml'):
+        index = load_xml_index(args.source, args.voltage)
+    else:
+        index = load_geojson_index(args.source)
+    if index is None:
+        return 1
+    server = make_server(index, args.host, args.port, args.cache_size)
+    logging.info("Загружено %d features, сервер слушает http://%s:%d/", len(index), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,12 @@
 import logging
+import os
 import xml.etree.ElementTree as ET
-import json
-from collections import defaultdict
+from array import array
+from time import perf_counter
+
+from geojson_writer import open_geojson_writer
+from line_topology import line_geometry, section_geometry
+from run_monitor import RunMonitor
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,6 +21,26 @@ GUID_OPORA = 'c0c2aca6-fcee-11e1-8837-20cf30e80dd7'  # Опора
 GUID_LAT = '9a326f2d-0841-11e6-80f2-001b21b9eac9'
 GUID_LON = 'b53e5884-0841-11e6-80f2-001b21b9eac9'
 
+# Тег объектов структуры сети в выгрузке 1С
+OBJECT_TAG = 'CatalogObject.урскСтруктураСети'
+NULL_REF = '00000000-0000-0000-0000-000000000000'
+NAN = float('nan')  # Отсутствующая координата в массивах хранилища
+
+# Поля объекта, которые использует конвейер; остальные теги при чтении отбрасываются
+OBJECT_FIELDS = {
+    'Ref': 'ref',
+    'Parent': 'parent',
+    'ВидТехническогоМеста': 'kind',
+    'НачальнаяОпора': 'start',
+    'КонечнаяОпора': 'end',
+    'гуид': 'guid',
+    'КодОбъекта': 'code',
+    'Description': 'name',
+    'Филиал': 'filial',
+    'Ответственный': 'responsible',
+    'КлассНапряжения': 'voltage_id',
+}
+
 # Вспомогательная функция для получения текста из элемента
 def get_text(element, tag):
     found = element.find(tag)
@@ -34,6 +59,350 @@ def extract_coordinates(static_params):
                 lon = float(value.replace('E', '').replace('W', '-'))
     return lat, lon
 
+# Компактная запись объекта сети: только поля, которые использует конвейер
+class NetworkObject:
+    __slots__ = ('ref', 'parent', 'kind', 'start', 'end', 'guid', 'code', 'name',
+                 'filial', 'responsible', 'voltage_id', 'lat', 'lon')
+
+    def __init__(self, ref=None, parent=None, kind=None, start=None, end=None, guid=None, code=None,
+                 name=None, filial=None, responsible=None, voltage_id=None, lat=None, lon=None):
+        self.ref = ref
+        self.parent = parent
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.guid = guid
+        self.code = code
+        self.name = name
+        self.filial = filial
+        self.responsible = responsible
+        self.voltage_id = voltage_id
+        self.lat = lat
+        self.lon = lon
+
+# Извлечение нужных полей объекта в компактную запись (как find: берётся первый тег)
+def extract_object(obj):
+    values = {}
+    static_params = None
+    for child in obj:
+        key = OBJECT_FIELDS.get(child.tag)
+        if key is not None:
+            if key not in values:
+                values[key] = child.text
+        elif child.tag == 'СтатическиеХарактеристики' and static_params is None:
+            static_params = child
+    record = NetworkObject(**values)
+    if record.kind == GUID_OPORA:
+        record.lat, record.lon = extract_coordinates(static_params)
+    return record
+
+# Потоковое чтение элементов объектов структуры сети: каждый элемент освобождается,
+# как только потребитель его обработал, поэтому память не растёт вместе с размером выгрузки
+def iter_object_elements(input_file):
+    context = ET.iterparse(input_file, events=('start', 'end'))
+    path = []
+    depth_in_object = 0
+    for event, elem in context:
+        if event == 'start':
+            path.append(elem)
+            if elem.tag == OBJECT_TAG:
+                depth_in_object += 1
+            continue
+        path.pop()
+        if elem.tag == OBJECT_TAG:
+            depth_in_object -= 1
+            if not depth_in_object:
+                yield elem
+        if not depth_in_object:
+            # Все дочерние элементы родителя уже прочитаны целиком — их можно отбросить
+            elem.clear()
+            if path:
+                del path[-1][:]
+
+# Потоковое чтение объектов структуры сети в компактные записи
+def iter_network_objects(input_file):
+    for elem in iter_object_elements(input_file):
+        yield extract_object(elem)
+
+# Фильтр выборки, применяемый при чтении выгрузки: объекты вне выборки отбрасываются
+# сразу и не попадают в хранилище. Условия объединяются по И:
+# filial — Ref филиала; min_voltage/max_voltage — диапазон напряжения по классам напряжения;
+# bbox — (min_lon, min_lat, max_lon, max_lat) для опор; line — Ref или гуид ЛЭП (её поддерево).
+# Опоры, на которые ссылаются оставленные пролеты, сохраняются всегда, чтобы relations
+# разрешались; опоры, встреченные в выгрузке раньше своего пролета, дочитываются
+# отдельным проходом только по недостающим Ref (missing_supports)
+class NetworkFilter:
+    def __init__(self, voltage_classes=None, filial=None, min_voltage=None, max_voltage=None, bbox=None, line=None):
+        self.filial = filial
+        self.bbox = bbox
+        self.line = line
+        self.voltage_ids = None
+        if min_voltage is not None or max_voltage is not None:
+            low = min_voltage if min_voltage is not None else float('-inf')
+            high = max_voltage if max_voltage is not None else float('inf')
+            self.voltage_ids = {ref for ref, vc in (voltage_classes or {}).items()
+                                if vc.get('voltage') is not None and low <= vc['voltage'] <= high}
+        self.kept_supports = set()  # Ref оставленных опор
+        self.needed_supports = set()  # Ref опор, на которые ссылаются оставленные пролеты
+
+    # Условия по полям самого объекта (филиал, класс напряжения)
+    def matches(self, obj):
+        if self.filial is not None and obj.filial != self.filial:
+            return False
+        return self.voltage_ids is None or obj.voltage_id in self.voltage_ids
+
+    # Опора с координатами вне bbox (про опору без координат по bbox ничего не известно)
+    def outside_bbox(self, obj):
+        if self.bbox is None or obj.lat is None or obj.lon is None:
+            return False
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        return not (min_lon <= obj.lon <= max_lon and min_lat <= obj.lat <= max_lat)
+
+    # Отбор объектов из потока. При фильтре по ЛЭП объект, чей родитель (ЛЭП или участок)
+    # ещё не встречался, ждёт его появления и затем оставляется или отбрасывается вместе
+    # с ним. С bbox пролеты (у них нет своих координат) отдаются в конце чтения, если хотя
+    # бы одна их опора попала в bbox, а опоры без координат — если на них ссылается такой пролет
+    def select(self, objects):
+        line = self.line
+        line_guids = {line} if line is not None else set()  # гуид выбранных ЛЭП
+        selected = set()  # Ref выбранных участков
+        rejected = set()  # гуид отброшенных ЛЭП и Ref отброшенных участков
+        pending = {}  # родитель, которого ещё не было в выгрузке -> ожидающие объекты
+        held_spans = []
+        held_supports = []
+        kept_supports, needed = self.kept_supports, self.needed_supports
+
+        def membership(parent, chosen):
+            if line is None or parent in chosen:
+                return True
+            return False if parent in rejected else None
+
+        # True — оставить, False — отбросить, None — ждать родителя
+        def decide(obj):
+            kind = obj.kind
+            if kind == GUID_OPORA:
+                if obj.ref in needed:
+                    return True
+                if not self.matches(obj) or self.outside_bbox(obj):
+                    return False
+                return membership(obj.parent, selected)
+            if not self.matches(obj):
+                return False
+            if kind == GUID_VL_LEP:
+                return line is None or obj.ref == line or obj.guid == line
+            if kind == GUID_UCHASTOK:
+                return membership(obj.parent, line_guids)
+            if kind == GUID_PROLET:
+                return membership(obj.parent, selected)
+            return False
+
+        def accept(seq, obj):
+            stack = [(seq, obj)]
+            while stack:
+                seq, obj = stack.pop()
+                kind = obj.kind
+                if kind == GUID_VL_LEP and line is not None:
+                    line_guids.add(obj.guid)
+                    stack.extend(pending.pop(obj.guid, ()))
+                elif kind == GUID_UCHASTOK and line is not None:
+                    selected.add(obj.ref)
+                    stack.extend(pending.pop(obj.ref, ()))
+                elif kind == GUID_PROLET:
+                    if self.bbox is not None:
+                        held_spans.append(obj)
+                        continue
+                    needed.add(obj.start)
+                    needed.add(obj.end)
+                elif kind == GUID_OPORA:
+                    if self.bbox is not None and (obj.lat is None or obj.lon is None) and obj.ref not in needed:
+                        held_supports.append(obj)
+                        continue
+                    kept_supports.add(obj.ref)
+                yield seq, obj
+
+        chosen = []  # При фильтре по ЛЭП: (номер в выгрузке, объект)
+        for seq, obj in enumerate(objects):
+            decision = decide(obj)
+            if decision:
+                if line is None:
+                    for _, kept in accept(seq, obj):
+                        yield kept
+                else:
+                    chosen.extend(accept(seq, obj))
+            elif decision is None:
+                pending.setdefault(obj.parent, []).append((seq, obj))
+            elif line is not None and obj.kind in (GUID_VL_LEP, GUID_UCHASTOK):
+                # Дочерние объекты отброшенных ЛЭП и участков больше не ждут
+                key = obj.guid if obj.kind == GUID_VL_LEP else obj.ref
+                rejected.add(key)
+                pending.pop(key, None)
+
+        # Объекты, дождавшиеся родителя, возвращаются на своё место в порядке выгрузки
+        chosen.sort(key=lambda item: item[0])
+        for _, obj in chosen:
+            yield obj
+
+        for span in held_spans:
+            if span.start in kept_supports or span.end in kept_supports:
+                needed.add(span.start)
+                needed.add(span.end)
+                yield span
+        for support in held_supports:
+            if support.ref in needed:
+                kept_supports.add(support.ref)
+                yield support
+
+    # Ref опор, на которые ссылаются оставленные пролеты, но которые не были оставлены при чтении
+    def missing_supports(self):
+        return self.needed_supports - self.kept_supports - {None}
+
+# Хранилище сети, собираемое один раз за запуск: объекты разложены по видам,
+# координаты опор лежат в массивах float, связи пролётов с опорами — индексы
+class NetworkStore:
+    def __init__(self):
+        self.object_count = 0
+        # Опоры
+        self.supports = []
+        self.support_index = {}
+        self.support_lat = array('d')
+        self.support_lon = array('d')
+        self.support_valid = bytearray()
+        # Пролёты (только с заполненным Parent)
+        self.spans = []
+        self.span_index = {}
+        self.span_start = array('q')
+        self.span_end = array('q')
+        self.span_valid = bytearray()
+        self.spans_by_section = {}  # Ref участка -> индексы пролётов
+        # Участки (только с заполненным Parent)
+        self.sections = []
+        self.section_index = {}
+        self.section_valid = bytearray()
+        self.sections_by_line = {}  # гуид ЛЭП -> индексы участков
+        # ЛЭП
+        self.lines = []
+        self.line_index = {}
+        self.line_valid = bytearray()
+        # Собирать ли геометрию участков и ЛЭП из пролетов (иначе geometry: null)
+        self.assemble_geometry = True
+
+    # Сборка хранилища из потока записей; при повторе Ref побеждает последняя запись.
+    # monitor (RunMonitor) получает этапы 'parse' и 'categorise'
+    @classmethod
+    def from_objects(cls, objects, monitor=None, input_size=None, position=None):
+        monitor = monitor or RunMonitor()
+        objects_by_ref = {}
+        with monitor.stage('parse', input_size, position):
+            for obj in objects:
+                if obj.ref:
+                    objects_by_ref[obj.ref] = obj
+                monitor.advance()
+        store = cls()
+        store.object_count = len(objects_by_ref)
+        with monitor.stage('categorise', len(objects_by_ref)):
+            for obj in objects_by_ref.values():
+                store.add(obj)
+                monitor.advance()
+            store.resolve()
+        return store
+
+    # Категоризация одного объекта
+    def add(self, obj):
+        kind = obj.kind
+        if kind == GUID_VL_LEP:
+            self.line_index[obj.ref] = len(self.lines)
+            self.lines.append(obj)
+        elif kind == GUID_UCHASTOK:
+            if obj.parent and obj.parent != NULL_REF:
+                self.section_index[obj.ref] = len(self.sections)
+                self.sections_by_line.setdefault(obj.parent, []).append(len(self.sections))
+                self.sections.append(obj)
+        elif kind == GUID_PROLET:
+            if obj.parent and obj.parent != NULL_REF:
+                self.span_index[obj.ref] = len(self.spans)
+                self.spans_by_section.setdefault(obj.parent, []).append(len(self.spans))
+                self.spans.append(obj)
+        elif kind == GUID_OPORA:
+            self.support_index[obj.ref] = len(self.supports)
+            self.supports.append(obj)
+            self.support_lat.append(obj.lat if obj.lat is not None else NAN)
+            self.support_lon.append(obj.lon if obj.lon is not None else NAN)
+
+    # Разрешение ссылок пролётов на опоры в индексы (-1 — опоры нет в выгрузке)
+    def resolve(self):
+        support_index = self.support_index
+        self.span_start = array('q', (support_index.get(span.start, -1) for span in self.spans))
+        self.span_end = array('q', (support_index.get(span.end, -1) for span in self.spans))
+
+    # Валидация снизу вверх: опоры -> пролёты -> участки -> ЛЭП.
+    # Возвращает число валидных участков (Ref родителей валидных пролетов)
+    def validate(self, monitor=None):
+        monitor = monitor or RunMonitor()
+        with monitor.stage('validate_supports', len(self.supports)):
+            self.validate_supports()
+            monitor.advance(len(self.supports))
+        with monitor.stage('validate_spans', len(self.spans)):
+            self.validate_spans()
+            monitor.advance(len(self.spans))
+        with monitor.stage('validate_sections', len(self.sections)):
+            valid_section_count = self.validate_sections()
+            monitor.advance(len(self.sections))
+        with monitor.stage('validate_lines', len(self.lines)):
+            self.validate_lines()
+            monitor.advance(len(self.lines))
+        return valid_section_count
+
+    # Опора валидна, если у неё есть обе координаты
+    def validate_supports(self):
+        self.support_valid = bytearray(bool(s.lat) and bool(s.lon) for s in self.supports)
+
+    # Пролет валиден, если обе его опоры есть в выгрузке и валидны
+    def validate_spans(self):
+        support_valid = self.support_valid
+        self.span_valid = bytearray(
+            a >= 0 and b >= 0 and support_valid[a] and support_valid[b]
+            for a, b in zip(self.span_start, self.span_end))
+
+    # Участок валиден, если у него есть хотя бы один валидный пролет
+    def validate_sections(self):
+        span_valid = self.span_valid
+        valid_section_refs = {ref for ref, spans in self.spans_by_section.items()
+                              if any(span_valid[i] for i in spans)}
+        self.section_valid = bytearray(s.ref in valid_section_refs for s in self.sections)
+        return len(valid_section_refs)
+
+    # ЛЭП валидна, если у её гуид есть хотя бы один валидный участок
+    def validate_lines(self):
+        section_valid = self.section_valid
+        self.line_valid = bytearray(
+            bool(line.guid) and line.guid != NULL_REF
+            and any(section_valid[i] for i in self.sections_by_line.get(line.guid, ()))
+            for line in self.lines)
+
+    # Координаты опоры в порядке GeoJSON [lon, lat]
+    def support_coordinates(self, index):
+        return [self.support_lon[index], self.support_lat[index]]
+
+    # Индексы валидных пролётов участка
+    def valid_spans_of(self, section_ref):
+        span_valid = self.span_valid
+        return [i for i in self.spans_by_section.get(section_ref, ()) if span_valid[i]]
+
+    # Объект хранилища по виду feature и индексу
+    def object_at(self, kind, index):
+        if kind == 'pylons':
+            return self.supports[index]
+        if kind == 'span':
+            return self.spans[index]
+        if kind == 'lines':
+            return self.sections[index]
+        return self.lines[index]
+
+    # Индексы валидных участков ЛЭП
+    def valid_sections_of(self, line):
+        section_valid = self.section_valid
+        return [i for i in self.sections_by_line.get(line.guid, ()) if section_valid[i]]
+
 # Функция для парсинга классов напряжения
 def parse_voltage_classes(voltage_file):
     try:
@@ -59,214 +428,278 @@ def parse_voltage_classes(voltage_file):
         logging.error("Ошибка парсинга '%s'.", voltage_file)
         return {}
 
-# Основная функция для обработки XML и создания GeoJSON
-def process_xml_to_geojson(input_file, voltage_file='Классы_напряжения.xml', output_file='output.geojson', log_file='missing_coordinates.log'):
-    # Парсинг классов напряжения
-    voltage_classes = parse_voltage_classes(voltage_file)
+# Дочитывание опор с заданными Ref, отброшенных при первом проходе с фильтром
+def load_missing_supports(input_file, store, refs, monitor=None):
+    monitor = monitor or RunMonitor()
+    refs = set(refs)
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        with monitor.stage('parse_relations', size, f.tell):
+            for obj in iter_network_objects(f):
+                if obj.kind == GUID_OPORA and obj.ref in refs:
+                    refs.discard(obj.ref)
+                    store.add(obj)
+                    store.object_count += 1
+                    if not refs:
+                        break
+                monitor.advance()
+    store.resolve()
 
-    # Парсинг основного XML файла
+# Потоковый парсинг основного XML файла в компактное хранилище (None при ошибке).
+# Прогресс этапа 'parse' считается по позиции в файле; network_filter (NetworkFilter)
+# отбрасывает объекты вне выборки прямо при чтении
+def load_network(input_file, monitor=None, network_filter=None):
     try:
-        tree = ET.parse(input_file)
-        root = tree.getroot()
+        with open(input_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            objects = iter_network_objects(f)
+            if network_filter is not None:
+                objects = network_filter.select(objects)
+            store = NetworkStore.from_objects(objects, monitor, size, f.tell)
+        missing = network_filter.missing_supports() if network_filter is not None else None
+        if missing:
+            logging.info("Дочитывание %d опор, на которые ссылаются выбранные пролеты", len(missing))
+            load_missing_supports(input_file, store, missing, monitor)
+        elif monitor is not None:
+            monitor.skip('parse_relations')
     except FileNotFoundError:
         logging.error("Файл '%s' не найден.", input_file)
-        return
+        return None
     except ET.ParseError:
         logging.error("Ошибка парсинга '%s'.", input_file)
-        return
-
-    # Словарь объектов по Ref
-    objects_by_ref = {get_text(obj, 'Ref'): obj for obj in root.findall('.//CatalogObject.урскСтруктураСети') if get_text(obj, 'Ref')}
-    logging.info("Спарсено %d объектов из '%s'", len(objects_by_ref), input_file)
-
-    # Категоризация объектов
-    lep_objects = {}
-    uchastok_objects = defaultdict(list)
-    prolet_objects = defaultdict(list)
-    opora_objects = {}
-
-    for ref, obj in objects_by_ref.items():
-        vid_teh_mesta = get_text(obj, 'ВидТехническогоМеста')
-        if vid_teh_mesta == GUID_VL_LEP:
-            lep_objects[ref] = obj
-        elif vid_teh_mesta == GUID_UCHASTOK:
-            parent = get_text(obj, 'Parent')
-            if parent and parent != '00000000-0000-0000-0000-000000000000':
-                uchastok_objects[parent].append(obj)
-        elif vid_teh_mesta == GUID_PROLET:
-            parent = get_text(obj, 'Parent')
-            if parent and parent != '00000000-0000-0000-0000-000000000000':
-                prolet_objects[parent].append(obj)
-        elif vid_teh_mesta == GUID_OPORA:
-            opora_objects[ref] = obj
-
-    logging.info("Найдено %d ЛЭП, %d участков, %d пролетов, %d опор", 
-                 len(lep_objects), sum(len(v) for v in uchastok_objects.values()), 
-                 sum(len(v) for v in prolet_objects.values()), len(opora_objects))
+        return None
+    logging.info("Спарсено %d объектов из '%s'", store.object_count, input_file)
+    logging.info("Найдено %d ЛЭП, %d участков, %d пролетов, %d опор",
+                 len(store.lines), len(store.sections), len(store.spans), len(store.supports))
+    return store
 
-    # Фильтрация валидных объектов
-    valid_supports = set()
-    invalid_supports = set()
-    missing_coords_supports = []
-    for opora_ref, opora_obj in opora_objects.items():
-        coords = extract_coordinates(opora_obj.find('СтатическиеХарактеристики'))
-        if coords and all(coords):
-            valid_supports.add(opora_ref)
-        else:
-            invalid_supports.add(opora_ref)
-            opora_name = get_text(opora_obj, 'Description')
-            missing_coords_supports.append((opora_ref, opora_name))
-    logging.info("Найдено %d валидных опор с координатами", len(valid_supports))
+# Валидация хранилища с записью лога опор без координат
+def validate_network(store, log_file, monitor=None):
+    valid_section_count = store.validate(monitor)
+    logging.info("Найдено %d валидных опор с координатами", sum(store.support_valid))
 
     # Запись в лог-файл опор без координат
+    missing_coords_supports = [s for s, valid in zip(store.supports, store.support_valid) if not valid]
     with open(log_file, 'w', encoding='utf-8') as f:
-        for ref, name in missing_coords_supports:
-            f.write(f"Опора '{name}' (Ref: {ref}) не имеет координат и не будет добавлена в GeoJSON.\n")
+        for opora in missing_coords_supports:
+            f.write(f"Опора '{opora.name}' (Ref: {opora.ref}) не имеет координат и не будет добавлена в GeoJSON.\n")
     logging.info("Обнаружено %d опор без координат, записано в '%s'", len(missing_coords_supports), log_file)
 
-    # Валидные пролеты
-    valid_spans = set()
-    invalid_spans = set()
-    for ref, prolets in prolet_objects.items():
-        for prolet in prolets:
-            prolet_ref = get_text(prolet, 'Ref')
-            nach_opora_ref = get_text(prolet, 'НачальнаяОпора')
-            kon_opora_ref = get_text(prolet, 'КонечнаяОпора')
-            if nach_opora_ref in valid_supports and kon_opora_ref in valid_supports:
-                valid_spans.add(prolet_ref)
-            else:
-                invalid_spans.add(prolet_ref)
-    logging.info("Найдено %d невалидных пролетов", len(invalid_spans))
-    logging.info("Найдено %d валидных пролетов", len(valid_spans))
-
-    # Валидные участки
-    valid_sections = set()
-    for uchastok_ref, prolets in prolet_objects.items():
-        if any(get_text(prolet, 'Ref') in valid_spans for prolet in prolets):
-            valid_sections.add(uchastok_ref)
-    logging.info("Найдено %d валидных участков", len(valid_sections))
-
-    # Валидные ЛЭП
-    valid_power_lines = set()
-    for lep_ref, lep_obj in lep_objects.items():
-        lep_guid = get_text(lep_obj, 'гуид')
-        if lep_guid and lep_guid != '00000000-0000-0000-0000-000000000000':
-            uchastki = [get_text(u, 'Ref') for u in uchastok_objects.get(lep_guid, []) if get_text(u, 'Ref') in valid_sections]
-            if uchastki:
-                valid_power_lines.add(lep_ref)
-    logging.info("Найдено %d валидных ЛЭП", len(valid_power_lines))
-
-    # Создание GeoJSON features
-    features = []
-
-    # Функция для получения свойств объекта
-    def get_properties(obj, obj_type, ref, relations=None):
-        properties = {
-            "ref": ref,
-            "type": obj_type,
-            "IdDZO": get_text(obj, 'КодОбъекта'),
-            "name": get_text(obj, 'Description'),
-            "filial": get_text(obj, 'Филиал'),
-            
-            "responsible": get_text(obj, 'Ответственный')          
-            
-        }
-        voltage_id = get_text(obj, 'КлассНапряжения')
-        properties["voltage_id"] = voltage_id
-        if voltage_id and voltage_id in voltage_classes:
-            properties["voltage"] = voltage_classes[voltage_id].get('voltage')
-        else:
-            properties["voltage"] = None
-        return properties
-
-    # Опоры (с пустым relations)
-    for opora_ref in valid_supports:
-        opora_obj = opora_objects[opora_ref]
-        coords = extract_coordinates(opora_obj.find('СтатическиеХарактеристики'))
-        features.append({
-            "type": "Feature",
-            "properties": get_properties(opora_obj, "pylons", opora_ref),
-            "system": {"relations": []},
-            "geometry": {"type": "Point", "coordinates": [coords[1], coords[0]]}
-        })
+    valid_span_count = sum(store.span_valid)
+    logging.info("Найдено %d невалидных пролетов", len(store.spans) - valid_span_count)
+    logging.info("Найдено %d валидных пролетов", valid_span_count)
+    logging.info("Найдено %d валидных участков", valid_section_count)
+    logging.info("Найдено %d валидных ЛЭП", sum(store.line_valid))
 
+# Функция для получения свойств объекта
+def get_properties(obj, obj_type, voltage_classes):
+    properties = {
+        "ref": obj.ref,
+        "type": obj_type,
+        "IdDZO": obj.code,
+        "name": obj.name,
+        "filial": obj.filial,
+        "responsible": obj.responsible,
+    }
+    voltage_id = obj.voltage_id
+    properties["voltage_id"] = voltage_id
+    if voltage_id and voltage_id in voltage_classes:
+        properties["voltage"] = voltage_classes[voltage_id].get('voltage')
+    else:
+        properties["voltage"] = None
+    return properties
 
-    for opora_ref in invalid_supports:
-        opora_obj = opora_objects[opora_ref]
-        features.append({
+# Опора: Point с пустым relations или feature без геометрии с предупреждением
+def support_feature(store, i, voltage_classes):
+    opora = store.supports[i]
+    if not store.support_valid[i]:
+        return {
             "type": "Feature",
-            "properties": get_properties(opora_obj, "pylons", opora_ref),
+            "properties": get_properties(opora, "pylons", voltage_classes),
             "geometry": None,
             "warning": "Опора без координат"
+        }
+    return {
+        "type": "Feature",
+        "properties": get_properties(opora, "pylons", voltage_classes),
+        "system": {"relations": []},
+        "geometry": {"type": "Point", "coordinates": store.support_coordinates(i)}
+    }
+
+# Пролет (с relations на опоры)
+def span_feature(store, i, voltage_classes):
+    prolet = store.spans[i]
+    relations = [{"objectId": prolet.start}, {"objectId": prolet.end}]
+    return {
+        "type": "Feature",
+        "properties": get_properties(prolet, "span", voltage_classes),
+        "system": {"relations": relations},
+        "geometry": {
+            "type": "LineString",
+            "coordinates": [store.support_coordinates(store.span_start[i]),
+                            store.support_coordinates(store.span_end[i])]
+        }
+    }
+
+# Участок (с relations на пролеты)
+def section_feature(store, i, voltage_classes):
+    uchastok = store.sections[i]
+    relations = [{"objectId": store.spans[j].ref} for j in store.valid_spans_of(uchastok.ref)]
+    return {
+        "type": "Feature",
+        "properties": get_properties(uchastok, "lines", voltage_classes),
+        "system": {"relations": relations},
+        "geometry": section_geometry(store, i) if store.assemble_geometry else None
+    }
+
+# ЛЭП (с relations на участки)
+def line_feature(store, i, voltage_classes):
+    lep = store.lines[i]
+    relations = [{"objectId": store.sections[j].ref} for j in store.valid_sections_of(lep)]
+    return {
+        "type": "Feature",
+        "properties": get_properties(lep, "fulllines", voltage_classes),
+        "system": {"relations": relations},
+        "geometry": line_geometry(store, i) if store.assemble_geometry else None
+    }
+
+# Построители features по виду объекта хранилища
+FEATURE_BUILDERS = {
+    'pylons': support_feature,
+    'span': span_feature,
+    'lines': section_feature,
+    'fulllines': line_feature,
+}
+
+# Порядок выдачи features: пары (вид, индекс в хранилище)
+def iter_feature_order(store):
+    # Сначала опоры с координатами, затем опоры без координат
+    for i, valid in enumerate(store.support_valid):
+        if valid:
+            yield 'pylons', i
+    for i, valid in enumerate(store.support_valid):
+        if not valid:
+            yield 'pylons', i
+
+    # Пролеты и участки — сгруппированными по родителю
+    for span_indexes in store.spans_by_section.values():
+        for i in span_indexes:
+            if store.span_valid[i]:
+                yield 'span', i
+
+    for section_indexes in store.sections_by_line.values():
+        for i in section_indexes:
+            if store.section_valid[i]:
+                yield 'lines', i
+
+    for i, valid in enumerate(store.line_valid):
+        if valid:
+            yield 'fulllines', i
+
+# Генератор GeoJSON features по провалидированному хранилищу
+def iter_features(store, voltage_classes):
+    for kind, i in iter_feature_order(store):
+        yield FEATURE_BUILDERS[kind](store, i, voltage_classes)
+
+FEATURE_KINDS = tuple(FEATURE_BUILDERS)
+
+# Features по позициям в порядке iter_feature_order — источник для сериализации в пуле
+# процессов (geojson_writer.iter_encoded): процесс получает хранилище и порядок (коды вида
+# и индексы — массивами, по 9 байт на feature) и строит features своего диапазона сам
+class FeatureSource:
+    def __init__(self, store, voltage_classes):
+        self.store = store
+        self.voltage_classes = voltage_classes
+        self.kinds = bytearray()
+        self.indexes = array('q')
+        codes = {kind: code for code, kind in enumerate(FEATURE_KINDS)}
+        for kind, i in iter_feature_order(store):
+            self.kinds.append(codes[kind])
+            self.indexes.append(i)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __call__(self, start, stop):
+        store, voltage_classes = self.store, self.voltage_classes
+        for code, i in zip(self.kinds[start:stop], self.indexes[start:stop]):
+            yield FEATURE_BUILDERS[FEATURE_KINDS[code]](store, i, voltage_classes)
+
+# Основная функция для обработки XML и создания GeoJSON.
+# output_format: 'geojson' (FeatureCollection), 'geojsonseq' (RFC 8142), 'topojson'
+# (опоры — общие вершины, пролеты — дуги, см. topojson_writer) или 'flatgeobuf'
+# (двоичный формат с пространственным индексом, см. flatgeobuf_writer, нужен numpy); compact — запись без отступов; compress — gzip (None — по расширению .gz);
+# assemble_geometry — собирать LineString/MultiLineString участков и ЛЭП из пролетов;
+# monitor — RunMonitor с колбэком прогресса и отменой (при отмене выбрасывается
+# RunCancelled, недописанный файл удаляется, а прежний output_file остаётся);
+# filial, min_voltage/max_voltage, bbox, line — фильтры выборки (см. NetworkFilter),
+# применяемые при чтении; report_file — отчёт проверки качества данных .json/.csv
+# (network_checks, нужен numpy); backend — сериализатор GeoJSON ('orjson' или 'json',
+# по умолчанию самый быстрый из установленных); encode_workers — строить и сериализовать
+# features частями в стольких процессах (не больше числа ядер). Возвращает монитор с отчётом по этапам
+def process_xml_to_geojson(input_file, voltage_file='Классы_напряжения.xml', output_file='output.geojson',
+                           log_file='missing_coordinates.log', output_format='geojson', compact=False, compress=None,
+                           assemble_geometry=True, monitor=None, filial=None, min_voltage=None, max_voltage=None,
+                           bbox=None, line=None, report_file=None, backend=None, encode_workers=None):
+    monitor = monitor or RunMonitor()
+
+    # Парсинг классов напряжения
+    voltage_classes = parse_voltage_classes(voltage_file)
+
+    network_filter = None
+    if any(value is not None for value in (filial, min_voltage, max_voltage, bbox, line)):
+        network_filter = NetworkFilter(voltage_classes, filial, min_voltage, max_voltage, bbox, line)
+
+    store = load_network(input_file, monitor, network_filter)
+    if store is None:
+        return monitor
+    store.assemble_geometry = assemble_geometry
+
+    # Фильтрация валидных объектов
+    validate_network(store, log_file, monitor)
+    if report_file is not None:
+        from network_checks import check_network, write_report
+        with monitor.stage('checks'):
+            write_report(check_network(store), report_file)
 
-        })
-
-
-    # Пролеты (с relations на опоры)
-    for uchastok_ref, prolets in prolet_objects.items():
-        for prolet in prolets:
-            prolet_ref = get_text(prolet, 'Ref')
-            if prolet_ref not in valid_spans:
-                continue
-            nach_opora_ref = get_text(prolet, 'НачальнаяОпора')
-            kon_opora_ref = get_text(prolet, 'КонечнаяОпора')
-            nach_opora = opora_objects.get(nach_opora_ref)
-            kon_opora = opora_objects.get(kon_opora_ref)
-            if not (nach_opora and kon_opora):
-                continue
-            nach_coords = extract_coordinates(nach_opora.find('СтатическиеХарактеристики'))
-            kon_coords = extract_coordinates(kon_opora.find('СтатическиеХарактеристики'))
-            if not (all(nach_coords) and all(kon_coords)):
-                continue
-            relations = [{"objectId": nach_opora_ref}, {"objectId": kon_opora_ref}]
-            features.append({
-                "type": "Feature",
-                "properties": get_properties(prolet, "span", prolet_ref, relations),
-                "system": {"relations": relations if relations is not None else []},
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [[nach_coords[1], nach_coords[0]], [kon_coords[1], kon_coords[0]]]
-                }
-            })
-
-
-    # Участки (с relations на пролеты)
-    for lep_guid, uchastki in uchastok_objects.items():
-        for uchastok in uchastki:
-            uchastok_ref = get_text(uchastok, 'Ref')
-            if uchastok_ref not in valid_sections:
-                continue
-            prolets = [get_text(p, 'Ref') for p in prolet_objects.get(uchastok_ref, []) if get_text(p, 'Ref') in valid_spans]
-            if prolets:
-                relations = [{"objectId": p} for p in prolets]
-                features.append({
-                    "type": "Feature",
-                    "properties": get_properties(uchastok, "lines", uchastok_ref, relations),
-                    "system": {"relations": relations if relations is not None else []},
-                    "geometry": None
-                })
-
-    # ЛЭП (с relations на участки)
-    for lep_ref in valid_power_lines:
-        lep_obj = lep_objects[lep_ref]
-        lep_guid = get_text(lep_obj, 'гуид')
-        uchastki = [get_text(u, 'Ref') for u in uchastok_objects.get(lep_guid, []) if get_text(u, 'Ref') in valid_sections]
-        if uchastki:
-            relations = [{"objectId": u} for u in uchastki]
-            features.append({
-                "type": "Feature",
-                "properties": get_properties(lep_obj, "fulllines", lep_ref, relations),
-                "system": {"relations": relations if relations is not None else []},
-                "geometry": None
-            })
-
-    logging.info("Сгенерировано %d features", len(features))
-
-    # Создание и запись GeoJSON
-    geojson = {"type": "FeatureCollection", "features": features}
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=2)
-    logging.info("GeoJSON записан в '%s' с %d features", output_file, len(features))
+    # Создание и потоковая запись GeoJSON features; время построения (emit)
+    # и сериализации с записью (write) учитывается раздельно
+    feature_count = (len(store.supports) + sum(store.span_valid) + sum(store.section_valid)
+                     + sum(store.line_valid))
+    if output_format == 'topojson':
+        from topojson_writer import write_topojson
+        with monitor.stage('emit', feature_count):
+            count = write_topojson(store, voltage_classes, output_file, compress=compress, monitor=monitor)
+    elif output_format == 'flatgeobuf':
+        from flatgeobuf_writer import write_flatgeobuf
+        with monitor.stage('emit', feature_count):
+            count = write_flatgeobuf(iter_features(store, voltage_classes), output_file, monitor=monitor)
+    else:
+        with open_geojson_writer(output_file, output_format, compact, compress, backend) as writer:
+            with monitor.stage('emit', feature_count):
+                write_seconds = 0.0
+                if encode_workers and encode_workers > 1:
+                    # Построение и сериализация в пуле процессов; в write — только запись готовых фрагментов
+                    source = FeatureSource(store, voltage_classes)
+                    for text in writer.iter_encoded(source, len(source), encode_workers):
+                        started = perf_counter()
+                        writer.write_encoded(text)
+                        write_seconds += perf_counter() - started
+                        monitor.advance()
+                else:
+                    for feature in iter_features(store, voltage_classes):
+                        started = perf_counter()
+                        writer.write(feature)
+                        write_seconds += perf_counter() - started
+                        monitor.advance()
+            monitor.stats['emit'].seconds -= write_seconds
+            monitor.add_time('write', write_seconds, writer.count)
+        count = writer.count
+    logging.info("Сгенерировано %d features", count)
+    if output_format not in ('topojson', 'flatgeobuf'):
+        logging.info("GeoJSON записан в '%s' с %d features", output_file, count)
+    logging.info("Время по этапам:\n%s", monitor.format_report())
+    return monitor
 
 if __name__ == "__main__":
-    process_xml_to_geojson('ЛЭП.xml')
\ No newline at end of file
+    process_xml_to_geojson('ЛЭП.xml')
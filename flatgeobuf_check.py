@@ -0,0 +1,157 @@
+import json
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+
+from final_xml_to_geojsonn import iter_features, load_network, parse_voltage_classes, validate_network
+from flatgeobuf_writer import COLUMNS, write_flatgeobuf
+
+# Проверка FlatGeobuf из flatgeobuf_writer независимым читателем — GDAL через pyogrio
+# (pip install pyogrio, GDAL входит в колёса). Выгрузка конвертируется во временный .fgb,
+# затем сверяются заголовок (число features, колонки, CRS, охват), каждая feature
+# (геометрия и колонки) и выборки по bbox, которые GDAL делает по R-дереву, с перебором
+# всех features. Результат — список расхождений, пустой, если файл прочитан верно.
+
+BBOX_QUERIES = 50  # Случайных bbox-запросов к индексу
+
+# Геометрия GeoJSON из ISO WKB, который возвращает GDAL (Point, LineString, MultiLineString)
+def wkb_geometry(data):
+    def read(offset):
+        geometry_type = struct.unpack_from('<I', data, offset + 1)[0]
+        offset += 5
+        if geometry_type == 1:
+            return {'type': 'Point', 'coordinates': list(struct.unpack_from('<2d', data, offset))}, offset + 16
+        count = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        if geometry_type == 2:
+            points = [list(struct.unpack_from('<2d', data, offset + 16 * i)) for i in range(count)]
+            return {'type': 'LineString', 'coordinates': points}, offset + 16 * count
+        if geometry_type != 5:
+            raise ValueError(f"Неожиданный тип геометрии WKB: {geometry_type}")
+        parts = []
+        for _ in range(count):
+            part, offset = read(offset)
+            parts.append(part['coordinates'])
+        return {'type': 'MultiLineString', 'coordinates': parts}, offset
+
+    return None if data is None else read(0)[0]
+
+def geometry_points(geometry):
+    coordinates = geometry['coordinates']
+    if geometry['type'] == 'Point':
+        return [coordinates]
+    if geometry['type'] == 'LineString':
+        return coordinates
+    return [point for part in coordinates for point in part]
+
+def geometry_bbox(geometry):
+    points = geometry_points(geometry)
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+# Значения колонок, которые writer должен был записать для feature
+def expected_columns(feature):
+    properties = dict(feature.get('properties') or {})
+    if 'system' in feature:
+        properties['relations'] = json.dumps(feature['system'].get('relations', []), ensure_ascii=False,
+                                             separators=(',', ':'))
+    properties['warning'] = feature.get('warning')
+    return {name: properties.get(name) for name, _ in COLUMNS}
+
+def same_value(expected, actual):
+    if expected is None:
+        return actual is None or (isinstance(actual, float) and math.isnan(actual))
+    if isinstance(actual, float):
+        return float(expected) == actual
+    return str(expected) == actual
+
+# Сверка .fgb с features, из которых он записан; возвращает список расхождений
+def check_flatgeobuf(features, fgb_file, queries=BBOX_QUERIES, seed=1):
+    import pyogrio
+    from pyogrio import raw
+
+    problems = []
+    names = [name for name, _ in COLUMNS]
+    bboxes = [geometry_bbox(f['geometry']) for f in features if f.get('geometry')]
+
+    # Заголовок
+    info = pyogrio.read_info(fgb_file)
+    if info['features'] != len(features):
+        problems.append(f"Заголовок: {info['features']} features вместо {len(features)}")
+    if list(info['fields']) != names:
+        problems.append(f"Заголовок: колонки {list(info['fields'])} вместо {names}")
+    if info['crs'] != 'EPSG:4326':
+        problems.append(f"Заголовок: CRS {info['crs']}")
+    if bboxes:
+        envelope = (min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+                    max(b[2] for b in bboxes), max(b[3] for b in bboxes))
+        if tuple(info['total_bounds']) != envelope:
+            problems.append(f"Заголовок: охват {tuple(info['total_bounds'])} вместо {envelope}")
+
+    # Features: порядок в файле другой (кривая Гильберта), поэтому сверка по (ref, type)
+    _, _, geometries, values = raw.read(fgb_file)
+    read = {}
+    for k, data in enumerate(geometries):
+        columns = {name: values[j][k] for j, name in enumerate(names)}
+        read.setdefault((columns['ref'], columns['type']), []).append((columns, wkb_geometry(data)))
+    for feature in features:
+        columns = expected_columns(feature)
+        candidates = read.get((columns['ref'], columns['type']), [])
+        geometry_expected = json.loads(json.dumps(feature.get('geometry')))  # кортежи -> списки, как из WKB
+        for n, (actual, geometry) in enumerate(candidates):
+            if geometry == geometry_expected and all(same_value(columns[name], actual[name]) for name in names):
+                del candidates[n]
+                break
+        else:
+            problems.append(f"Feature {columns['type']} {columns['ref']} прочитана не так, как записана")
+
+    # Выборки по bbox через R-дерево: GDAL не должен вернуть лишнего (охват feature не
+    # пересекает bbox) и не должен потерять feature, у которой есть вершина внутри bbox
+    if bboxes:
+        rng = random.Random(seed)
+        for _ in range(queries):
+            x0, x1 = sorted(rng.uniform(envelope[0], envelope[2]) for _ in range(2))
+            y0, y1 = sorted(rng.uniform(envelope[1], envelope[3]) for _ in range(2))
+            _, _, found, found_values = raw.read(fgb_file, bbox=(x0, y0, x1, y1), columns=['ref', 'type'])
+            found_keys = set()
+            for k, data in enumerate(found):
+                key = (found_values[0][k], found_values[1][k])
+                found_keys.add(key)
+                b = geometry_bbox(wkb_geometry(data))
+                if b[0] > x1 or b[2] < x0 or b[1] > y1 or b[3] < y0:
+                    problems.append(f"bbox {(x0, y0, x1, y1)}: лишняя feature {key}")
+            for feature in features:
+                geometry = feature.get('geometry')
+                if geometry and any(x0 <= x <= x1 and y0 <= y <= y1 for x, y in geometry_points(geometry)):
+                    key = (feature['properties']['ref'], feature['properties']['type'])
+                    if key not in found_keys:
+                        problems.append(f"bbox {(x0, y0, x1, y1)}: индекс потерял feature {key}")
+    return problems
+
+# Конвертация выгрузки во временный .fgb и его проверка; None, если выгрузка не прочитана
+def check_xml(input_file, voltage_file='Классы_напряжения.xml', log_file='missing_coordinates.log'):
+    voltage_classes = parse_voltage_classes(voltage_file)
+    store = load_network(input_file)
+    if store is None:
+        return None
+    validate_network(store, log_file)
+    features = list(iter_features(store, voltage_classes))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fgb_file = os.path.join(tmp_dir, 'check.fgb')
+        write_flatgeobuf(features, fgb_file)
+        return check_flatgeobuf(features, fgb_file)
+
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'ЛЭП.xml'
+    voltage_file = sys.argv[2] if len(sys.argv) > 2 else 'Классы_напряжения.xml'
+    problems = check_xml(input_file, voltage_file)
+    if problems is None:
+        sys.exit(2)
+    for problem in problems:
+        print(problem)
+    print(f"Расхождений: {len(problems)}")
+    sys.exit(1 if problems else 0)
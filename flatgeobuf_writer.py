@@ -0,0 +1,316 @@
+import json
+import logging
+import math
+import struct
+import tempfile
+
+import numpy as np
+
+from geojson_writer import replace_on_success
+
+# Запись features в FlatGeobuf (https://flatgeobuf.org) без GDAL и пакета flatbuffers:
+# заголовок и features кодируются в FlatBuffers вручную по схемам header.fbs и
+# feature.fbs, после заголовка пишется упакованное R-дерево Гильберта, а features
+# идут в порядке кривой Гильберта. Читатель может по индексу запросить диапазоны
+# байтов только нужных features. Модуль требует numpy (pip install numpy).
+
+MAGIC = b'fgb\x03fgb\x00'  # FlatGeobuf 3.0
+INDEX_NODE_SIZE = 16
+HILBERT_MAX = (1 << 16) - 1
+
+# GeometryType и ColumnType из схемы FlatGeobuf
+GEOMETRY_TYPES = {'Point': 1, 'LineString': 2, 'MultiLineString': 5}
+COLUMN_DOUBLE = 10
+COLUMN_STRING = 11
+COLUMN_JSON = 12
+
+# Колонки свойств в порядке номеров; relations и warning — как в GeoJSON ('system', 'warning')
+COLUMNS = (
+    ('ref', COLUMN_STRING),
+    ('type', COLUMN_STRING),
+    ('IdDZO', COLUMN_STRING),
+    ('name', COLUMN_STRING),
+    ('filial', COLUMN_STRING),
+    ('responsible', COLUMN_STRING),
+    ('voltage_id', COLUMN_STRING),
+    ('voltage', COLUMN_DOUBLE),
+    ('relations', COLUMN_JSON),
+    ('warning', COLUMN_STRING),
+)
+
+# Элемент R-дерева: bbox и смещение (байт feature для листьев, номер первого потомка для узлов)
+NODE_DTYPE = np.dtype([('min_x', '<f8'), ('min_y', '<f8'), ('max_x', '<f8'), ('max_y', '<f8'), ('offset', '<u8')])
+
+# Поле таблицы FlatBuffers: номер поля по схеме и либо скаляр (формат struct, значение),
+# либо ссылка на дочерний объект (fmt=None): str — строка, bytes — [ubyte],
+# Vector — вектор скаляров, Table — таблица, list — вектор таблиц
+class Table:
+    __slots__ = ('fields',)
+
+    def __init__(self, *fields):
+        self.fields = [field for field in fields if field[2] is not None]
+
+class Vector:
+    __slots__ = ('fmt', 'values')
+
+    def __init__(self, fmt, values):
+        self.fmt = fmt
+        self.values = values
+
+# Сериализация таблицы root в буфер FlatBuffers с префиксом размера (uint32).
+# Объекты пишутся от начала к концу: ссылки (uoffset) всегда указывают вперёд,
+# выравнивание считается от начала префикса, как при чтении size-prefixed буфера
+def build_buffer(root):
+    buf = bytearray(8)
+
+    def align(alignment, extra=0):
+        buf.extend(bytes(-(len(buf) + extra) % alignment))
+
+    def write_child(child):
+        if isinstance(child, Table):
+            return write_table(child)
+        align(4)
+        if isinstance(child, str):
+            data = child.encode('utf-8')
+            pos = len(buf)
+            buf.extend(struct.pack('<I', len(data)) + data + b'\0')
+        elif isinstance(child, bytes):
+            pos = len(buf)
+            buf.extend(struct.pack('<I', len(child)) + child)
+        elif isinstance(child, Vector):
+            align(struct.calcsize(child.fmt), 4)
+            pos = len(buf)
+            buf.extend(struct.pack(f'<I{len(child.values)}{child.fmt}', len(child.values), *child.values))
+        else:
+            pos = len(buf)
+            buf.extend(struct.pack('<I', len(child)) + bytes(4 * len(child)))
+            for k, table in enumerate(child):
+                slot = pos + 4 + 4 * k
+                struct.pack_into('<I', buf, slot, write_table(table) - slot)
+        return pos
+
+    def write_table(table):
+        # Раскладка полей: сначала крупные скаляры, чтобы все были выровнены
+        fields = sorted(table.fields, key=lambda f: -(struct.calcsize(f[1]) if f[1] else 4))
+        layout = []
+        size = 4
+        for index, fmt, value in fields:
+            width = struct.calcsize(fmt) if fmt else 4
+            size += -size % width
+            layout.append((index, fmt, value, size))
+            size += width
+        field_count = max((f[0] for f in fields), default=-1) + 1
+        vtable = [0] * field_count
+        for index, _, _, offset in layout:
+            vtable[index] = offset
+        align(2)
+        vtable_pos = len(buf)
+        buf.extend(struct.pack(f'<{2 + field_count}H', 4 + 2 * field_count, size, *vtable))
+        align(8 if any(fmt and struct.calcsize(fmt) == 8 for _, fmt, _ in fields) else 4)
+        table_pos = len(buf)
+        buf.extend(bytes(size))
+        struct.pack_into('<i', buf, table_pos, table_pos - vtable_pos)
+        for _, fmt, value, offset in layout:
+            if fmt:
+                struct.pack_into('<' + fmt, buf, table_pos + offset, value)
+        for _, fmt, value, offset in layout:
+            if not fmt:
+                struct.pack_into('<I', buf, table_pos + offset, write_child(value) - (table_pos + offset))
+        return table_pos
+
+    struct.pack_into('<I', buf, 4, write_table(root) - 4)
+    struct.pack_into('<I', buf, 0, len(buf) - 4)
+    return bytes(buf)
+
+# Значения свойств feature в двоичном виде FlatGeobuf: (номер колонки uint16, значение)
+def encode_properties(feature):
+    properties = dict(feature.get('properties') or {})
+    system = feature.get('system')
+    if system is not None:
+        properties['relations'] = json.dumps(system.get('relations', []), ensure_ascii=False, separators=(',', ':'))
+    properties['warning'] = feature.get('warning')
+    parts = []
+    for column, (name, column_type) in enumerate(COLUMNS):
+        value = properties.get(name)
+        if value is None:
+            continue
+        if column_type == COLUMN_DOUBLE:
+            parts.append(struct.pack('<Hd', column, float(value)))
+        else:
+            data = str(value).encode('utf-8')
+            parts.append(struct.pack('<HI', column, len(data)) + data)
+    return b''.join(parts)
+
+# Геометрия FlatGeobuf и bbox (min_x, min_y, max_x, max_y); для feature без геометрии — (None, пустой bbox)
+def encode_geometry(geometry):
+    if geometry is None:
+        return None, (math.inf, math.inf, -math.inf, -math.inf)
+    kind = geometry['type']
+    if kind == 'Point':
+        lines = [[geometry['coordinates']]]
+    elif kind == 'LineString':
+        lines = [geometry['coordinates']]
+    else:
+        lines = geometry['coordinates']
+    xy = [c for line in lines for point in line for c in point]
+    ends = None
+    if kind == 'MultiLineString' and len(lines) > 1:
+        ends, end = [], 0
+        for line in lines:
+            end += len(line)
+            ends.append(end)
+    xs, ys = xy[0::2], xy[1::2]
+    table = Table((0, None, Vector('I', ends) if ends else None), (1, None, Vector('d', xy)),
+                  (6, 'B', GEOMETRY_TYPES[kind]))
+    return table, (min(xs), min(ys), max(xs), max(ys))
+
+# Кривая Гильберта для массивов x, y (uint32, 0..HILBERT_MAX) — векторный вариант hilbert() эталонной реализации
+def hilbert(x, y):
+    x = x.astype(np.uint32)
+    y = y.astype(np.uint32)
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C = C ^ ((a & (c >> 2)) ^ (b & (d >> 2)))
+    D = D ^ ((b & (c >> 2)) ^ ((a ^ b) & (d >> 2)))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C = C ^ ((a & (c >> 4)) ^ (b & (d >> 4)))
+    D = D ^ ((b & (c >> 4)) ^ ((a ^ b) & (d >> 4)))
+
+    a, b, c, d = A, B, C, D
+    C = C ^ ((a & (c >> 8)) ^ (b & (d >> 8)))
+    D = D ^ ((b & (c >> 8)) ^ ((a ^ b) & (d >> 8)))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+        i0 = (i0 | (i0 << shift)) & mask
+        i1 = (i1 | (i1 << shift)) & mask
+    return (i1 << 1) | i0
+
+# Порядок features по убыванию значения Гильберта центра bbox (как hilbertSort эталонной реализации);
+# features без геометрии — в конце
+def hilbert_order(bboxes, extent):
+    min_x, min_y, max_x, max_y = extent
+    width, height = max_x - min_x, max_y - min_y
+    empty = bboxes[:, 0] > bboxes[:, 2]
+    # Центры только для непустых bbox: (inf + -inf) пустых дал бы NaN и RuntimeWarning
+    center_x = np.full(len(bboxes), min_x)
+    center_y = np.full(len(bboxes), min_y)
+    center_x[~empty] = (bboxes[~empty, 0] + bboxes[~empty, 2]) / 2
+    center_y[~empty] = (bboxes[~empty, 1] + bboxes[~empty, 3]) / 2
+    x = np.floor(HILBERT_MAX * (center_x - min_x) / width) if width else np.zeros(len(bboxes))
+    y = np.floor(HILBERT_MAX * (center_y - min_y) / height) if height else np.zeros(len(bboxes))
+    values = hilbert(x, y).astype(np.int64)
+    values[empty] = -1
+    return np.argsort(-values, kind='stable')
+
+# Число узлов на каждом уровне дерева, начиная с листьев
+def level_sizes(item_count, node_size=INDEX_NODE_SIZE):
+    sizes = [item_count]
+    n = item_count
+    while True:
+        n = -(-n // node_size)
+        sizes.append(n)
+        if n == 1:
+            return sizes
+
+# Упакованное R-дерево: корень первым, листья (bbox и смещения features) в конце
+def packed_rtree(bboxes, offsets, node_size=INDEX_NODE_SIZE):
+    sizes = level_sizes(len(bboxes), node_size)
+    nodes = np.zeros(sum(sizes), dtype=NODE_DTYPE)
+    starts = []
+    start = len(nodes)
+    for size in sizes:
+        start -= size
+        starts.append(start)
+    leaves = nodes[starts[0]:]
+    leaves['min_x'], leaves['min_y'], leaves['max_x'], leaves['max_y'] = bboxes.T
+    leaves['offset'] = offsets
+    for level in range(len(sizes) - 1):
+        children = nodes[starts[level]:starts[level] + sizes[level]]
+        groups = np.arange(0, sizes[level], node_size)
+        parents = nodes[starts[level + 1]:starts[level + 1] + sizes[level + 1]]
+        parents['min_x'] = np.minimum.reduceat(children['min_x'], groups)
+        parents['min_y'] = np.minimum.reduceat(children['min_y'], groups)
+        parents['max_x'] = np.maximum.reduceat(children['max_x'], groups)
+        parents['max_y'] = np.maximum.reduceat(children['max_y'], groups)
+        parents['offset'] = starts[level] + groups
+    return nodes.tobytes()
+
+# Заголовок FlatGeobuf (таблица Header)
+def build_header(name, envelope, geometry_type, feature_count, index_node_size):
+    columns = [Table((0, None, column), (1, 'B', column_type)) for column, column_type in COLUMNS]
+    crs = Table((0, None, 'EPSG'), (1, 'i', 4326))
+    return build_buffer(Table(
+        (0, None, name),
+        (1, None, Vector('d', envelope) if envelope else None),
+        (2, 'B', geometry_type),
+        (7, None, columns),
+        (8, 'Q', feature_count),
+        (9, 'H', index_node_size),
+        (10, None, crs),
+    ))
+
+# Запись features в FlatGeobuf. Features сначала кодируются во временный файл,
+# затем копируются в порядке кривой Гильберта после заголовка и индекса; output_file
+# заменяется только готовым файлом (см. replace_on_success).
+# monitor (RunMonitor) продвигается на каждую feature. Возвращает число features
+def write_flatgeobuf(features, output_file, name='lep', monitor=None):
+    sizes, bboxes, types = [], [], set()
+    with tempfile.TemporaryFile() as spool:
+        for feature in features:
+            geometry, bbox = encode_geometry(feature.get('geometry'))
+            data = build_buffer(Table((0, None, geometry), (1, None, encode_properties(feature))))
+            spool.write(data)
+            sizes.append(len(data))
+            bboxes.append(bbox)
+            if geometry is not None:
+                types.add(feature['geometry']['type'])
+            if monitor is not None:
+                monitor.advance()
+
+        count = len(sizes)
+        sizes = np.array(sizes, dtype=np.uint64)
+        bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        spool_offsets = np.zeros(count, dtype=np.uint64)
+        np.cumsum(sizes[:-1], out=spool_offsets[1:])
+        present = bboxes[:, 0] <= bboxes[:, 2]
+        envelope = None
+        if present.any():
+            envelope = [bboxes[present, 0].min(), bboxes[present, 1].min(),
+                        bboxes[present, 2].max(), bboxes[present, 3].max()]
+        geometry_type = GEOMETRY_TYPES[types.pop()] if len(types) == 1 else 0
+
+        with replace_on_success(output_file) as partial_file, open(partial_file, 'wb') as f:
+            f.write(MAGIC)
+            if envelope is not None:
+                order = hilbert_order(bboxes, envelope)
+                f.write(build_header(name, envelope, geometry_type, count, INDEX_NODE_SIZE))
+                offsets = np.zeros(count, dtype=np.uint64)
+                np.cumsum(sizes[order][:-1], out=offsets[1:])
+                f.write(packed_rtree(bboxes[order], offsets))
+            else:
+                # Без единой геометрии индекс не строится
+                order = np.arange(count)
+                f.write(build_header(name, None, geometry_type, count, 0))
+            spool.flush()
+            for i in order:
+                spool.seek(int(spool_offsets[i]))
+                f.write(spool.read(int(sizes[i])))
+    logging.info("FlatGeobuf записан в '%s': %d features", output_file, count)
+    return count
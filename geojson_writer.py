@@ -0,0 +1,327 @@
+import gzip
+import json
+import math
+import os
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # Без orjson сериализует стандартный json
+    orjson = None
+
+# Потоковая запись GeoJSON: каждая feature сериализуется и пишется сразу,
+# поэтому в памяти не копится ни список features, ни итоговая строка.
+# Сериализатор выбирается по backend: 'orjson' (если установлен, pip install orjson)
+# или 'json' (стандартная библиотека); результат байт в байт одинаков. Features
+# можно строить и сериализовать частями в пуле процессов (workers), порядок записи сохраняется.
+
+RS = '\x1e'  # Разделитель записей GeoJSONSeq (RFC 8142)
+FEATURE_INDENT = '\n    '  # Отступ feature внутри "features" при indent=2
+CHUNK_SIZE = 2000  # Features в одной части при сериализации в пуле процессов
+
+BACKENDS = ('orjson', 'json')
+DEFAULT_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Имя сериализатора: None — самый быстрый из доступных
+def resolve_backend(backend=None):
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный сериализатор: {backend}")
+    if backend == 'orjson' and orjson is None:
+        raise ValueError("Сериализатор orjson не установлен (pip install orjson)")
+    return backend
+
+_compact_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+_encode_string = json.encoder.encode_basestring
+_float_repr = float.__repr__
+
+# Скаляр JSON так же, как его пишет json (NaN и Infinity — тоже как в json)
+def _scalar(value):
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, str):
+        return _encode_string(value)
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return _float_repr(value)
+    return _compact_encode(value)
+
+# Значение с отступом 2 на уровне indent ('\n' + пробелы) — то же, что
+# json.dumps(value, indent=2, ensure_ascii=False) с заменой '\n' на indent, но без
+# чистого Python-кодировщика json: строки кодирует C-функция, а массивы чисел
+# (координаты) собираются одним join
+def _indented(value, indent):
+    if isinstance(value, dict):
+        if not value:
+            return '{}'
+        inner = indent + '  '
+        return '{' + inner + (',' + inner).join(
+            (_encode_string(key) if isinstance(key, str) else _encode_string(_scalar(key))) + ': ' + _indented(item, inner)
+            for key, item in value.items()) + indent + '}'
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return '[]'
+        inner = indent + '  '
+        if all(type(item) is float for item in value):
+            text = (',' + inner).join(map(_float_repr, value))
+            if 'n' not in text:  # nan и inf пишутся иначе, чем в json
+                return '[' + inner + text + indent + ']'
+        return '[' + inner + (',' + inner).join(_indented(item, inner) for item in value) + indent + ']'
+    return _scalar(value)
+
+# Совпадает ли вывод orjson с json. Расходятся числа с экспонентой (orjson пишет
+# 1e-8 и 0.00001 вместо 1e-08 и 1e-05) и NaN/Infinity (orjson пишет null). Проверка
+# идёт по «скелету» вывода без содержимого строк и литералов true/false: в нём
+# буква e бывает только в экспоненте, а null в массиве — только вместо NaN координаты
+def _orjson_matches(data):
+    if b'\\' in data:
+        data = data.replace(b'\\\\', b'').replace(b'\\"', b'')
+    skeleton = b''.join(data.split(b'"')[::2]).replace(b'true', b'').replace(b'false', b'')
+    return (b'e' not in skeleton and b'E' not in skeleton and b'0.0000' not in skeleton
+            and skeleton.count(b'null') == skeleton.count(b':null') + skeleton.count(b': null'))
+
+def _orjson_dumps(feature, option=0):
+    try:
+        data = orjson.dumps(feature, option=option)
+    except TypeError:  # Целые вне int64, строки с суррогатами
+        return None
+    if not _orjson_matches(data):
+        return None
+    properties = feature.get('properties') if isinstance(feature, dict) else None
+    if properties and any(isinstance(v, float) and not math.isfinite(v) for v in properties.values()):
+        return None
+    return data.decode('utf-8')
+
+# Сериализация feature без отступов (для FeatureCollection compact и GeoJSONSeq)
+def dumps_compact(feature, backend='json'):
+    if backend == 'orjson':
+        text = _orjson_dumps(feature)
+        if text is not None:
+            return text
+    return _compact_encode(feature)
+
+# Сериализация feature с отступом 2 на уровне FeatureCollection.features
+def dumps_indented(feature, backend='json', indent=FEATURE_INDENT):
+    if backend == 'orjson':
+        text = _orjson_dumps(feature, orjson.OPT_INDENT_2)
+        if text is not None:
+            return text.replace('\n', indent)
+    return _indented(feature, indent)
+
+_feature_source = None
+
+def init_encode_worker(source):
+    global _feature_source
+    _feature_source = source
+
+# Построение и сериализация features с позициями [start, stop) в процессе пула
+def encode_range(start, stop, compact, backend):
+    dumps = dumps_compact if compact else dumps_indented
+    return [dumps(feature, backend) for feature in _feature_source(start, stop)]
+
+# Сериализованные features в исходном порядке. source(start, stop) отдаёт features
+# с позициями [start, stop) из count: при workers > 1 процессы пула получают source
+# один раз при запуске (при fork — без pickle) и сами строят и сериализуют свои
+# диапазоны по chunk_size, родителю возвращается только текст; одновременно в работе
+# не больше 2 * workers диапазонов. Процессов не больше, чем ядер: на одном ядре пул
+# только добавил бы накладные расходы, и сериализация идёт в текущем процессе
+def iter_encoded(source, count, compact, backend, workers=None, chunk_size=CHUNK_SIZE):
+    workers = min(workers or 1, os.cpu_count() or 1)
+    if workers < 2:
+        dumps = dumps_compact if compact else dumps_indented
+        for feature in source(0, count):
+            yield dumps(feature, backend)
+        return
+    starts = iter(range(0, count, chunk_size))
+    executor = ProcessPoolExecutor(workers, initializer=init_encode_worker, initargs=(source,))
+    pending = deque()
+    try:
+        while True:
+            start = next(starts, None)
+            if start is not None:
+                pending.append(executor.submit(encode_range, start, min(start + chunk_size, count), compact, backend))
+            if pending and (start is None or len(pending) >= 2 * workers):
+                yield from pending.popleft().result()
+            elif start is None:
+                return
+    finally:
+        # Недописанные части снимаются вручную: cancel_futures появился только в Python 3.9
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+# Открытие текстового файла для записи, при необходимости через gzip
+def open_text_sink(output_file, compress=None):
+    if compress is None:
+        compress = str(output_file).endswith('.gz')
+    if compress:
+        return gzip.open(output_file, 'wt', encoding='utf-8', newline='')
+    return open(output_file, 'w', encoding='utf-8', newline='')
+
+# Запись через временный файл рядом с output_file: он заменяет output_file только при
+# успешном завершении блока, а при ошибке или отмене удаляется и прежний файл остаётся
+@contextmanager
+def replace_on_success(output_file):
+    partial_file = f'{output_file}.part'
+    try:
+        yield partial_file
+    except BaseException:
+        discard_partial(partial_file)
+        raise
+    os.replace(partial_file, output_file)
+
+def discard_partial(partial_file):
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+
+# Запись FeatureCollection по одной feature. В режиме с отступами результат
+# совпадает байт в байт с json.dump(geojson, f, ensure_ascii=False, indent=2).
+# Пишется в output_file.part, который заменяет output_file при закрытии без ошибки
+class GeoJSONWriter:
+    def __init__(self, output_file, compact=False, compress=None, backend=None):
+        self.backend = resolve_backend(backend)
+        self.output_file = output_file
+        self.partial_file = f'{output_file}.part'
+        if compress is None:
+            compress = str(output_file).endswith('.gz')
+        self.file = open_text_sink(self.partial_file, compress)
+        self.compact = compact
+        self.count = 0
+        self.separator = ',' if compact else ',\n    '  # Между соседними фрагментами
+        if compact:
+            header = '{"type":"FeatureCollection","features":['
+        else:
+            header = '{\n  "type": "FeatureCollection",\n  "features": ['
+        self.file.write(header)
+        self.position = len(header)
+
+    # Сериализация одной feature в фрагмент, готовый к записи этим писателем
+    def encode(self, feature):
+        if self.compact:
+            return dumps_compact(feature, self.backend)
+        return dumps_indented(feature, self.backend)
+
+    # Фрагменты features source(start, stop) в исходном порядке, построенные и
+    # сериализованные в workers процессах (см. iter_encoded)
+    def iter_encoded(self, source, count, workers=None):
+        return iter_encoded(source, count, self.compact, self.backend, workers)
+
+    # Запись заранее сериализованного фрагмента (результата encode)
+    def write_encoded(self, text):
+        if self.compact:
+            self.file.write(',' + text if self.count else text)
+        else:
+            self.file.write((',\n    ' if self.count else '\n    ') + text)
+        self.count += 1
+
+    def write(self, feature):
+        self.write_encoded(self.encode(feature))
+
+    # Запись готового блока: байты UTF-8 count подряд идущих фрагментов, разделённых
+    # separator, — так, как они лежат в выводе этого же формата (см. incremental).
+    # Возвращает смещение блока в несжатом выводе; position ведётся только для
+    # заголовка и таких блоков, поэтому с write_encoded они не смешиваются
+    def write_fragments(self, data, count):
+        prefix = self.separator if self.count else ('' if self.compact else '\n    ')
+        self.file.write(prefix)
+        self.file.flush()
+        self.file.buffer.write(data)
+        offset = self.position + len(prefix)
+        self.position = offset + len(data)
+        self.count += count
+        return offset
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.compact:
+            self.file.write(']}')
+        else:
+            self.file.write('\n  ]\n}' if self.count else ']\n}')
+        self.file.close()
+        os.replace(self.partial_file, self.output_file)
+
+    # Прерванная запись: недописанный файл удаляется, прежний output_file не трогается
+    def abort(self):
+        self.file.close()
+        discard_partial(self.partial_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# Запись GeoJSONSeq (RFC 8142): каждая feature — отдельная строка с префиксом RS
+class GeoJSONSeqWriter:
+    def __init__(self, output_file, compact=True, compress=None, backend=None):
+        self.backend = resolve_backend(backend)
+        self.output_file = output_file
+        self.partial_file = f'{output_file}.part'
+        if compress is None:
+            compress = str(output_file).endswith('.gz')
+        self.file = open_text_sink(self.partial_file, compress)
+        self.count = 0
+        self.separator = '\n' + RS
+        self.position = 0
+
+    def encode(self, feature):
+        return dumps_compact(feature, self.backend)
+
+    def iter_encoded(self, source, count, workers=None):
+        return iter_encoded(source, count, True, self.backend, workers)
+
+    def write_encoded(self, text):
+        self.file.write(RS + text + '\n')
+        self.count += 1
+
+    def write(self, feature):
+        self.write_encoded(self.encode(feature))
+
+    def write_fragments(self, data, count):
+        self.file.write(RS)
+        self.file.flush()
+        self.file.buffer.write(data)
+        self.file.write('\n')
+        offset = self.position + len(RS)
+        self.position = offset + len(data) + 1
+        self.count += count
+        return offset
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.replace(self.partial_file, self.output_file)
+
+    def abort(self):
+        self.file.close()
+        discard_partial(self.partial_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# Выбор писателя по формату: 'geojson' или 'geojsonseq'; backend — сериализатор (см. BACKENDS)
+def open_geojson_writer(output_file, output_format='geojson', compact=False, compress=None, backend=None):
+    if output_format == 'geojson':
+        return GeoJSONWriter(output_file, compact, compress, backend)
+    if output_format == 'geojsonseq':
+        return GeoJSONSeqWriter(output_file, compress=compress, backend=backend)
+    raise ValueError(f"Неизвестный формат вывода: {output_format}")
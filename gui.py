@@ -2,48 +2,54 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import scrolledtext
 from tkinter import ttk
-import threading
-import sys
+import multiprocessing
 import os
 import logging
 
-from final_xml_to_geojsonn import process_xml_to_geojson
+from batch_jobs import CANCELLED, DONE, FAILED, FINISHED, PENDING, RUNNING, JobQueue, QueueLogHandler
 
 logging.raiseExceptions = False
 
-class RedirectText(object):
-    def __init__(self, text_widget):
-        self.output = text_widget
+# Названия этапов конвертера для строки статуса
+STAGE_TITLES = {
+    'parse': "Чтение XML",
+    'parse_relations': "Дочитывание опор",
+    'categorise': "Категоризация объектов",
+    'validate_supports': "Проверка опор",
+    'validate_spans': "Проверка пролетов",
+    'validate_sections': "Проверка участков",
+    'validate_lines': "Проверка ЛЭП",
+    'checks': "Проверка качества данных",
+    'emit': "Запись GeoJSON",
+}
 
-    def write(self, string):
-        self.output.configure(state='normal')
-        self.output.insert(tk.END, string)
-        self.output.see(tk.END)
-        self.output.configure(state='disabled')
+POLL_MS = 100  # Период опроса очереди сообщений заданий
+MAX_LOG_LINES = 5000  # Старые строки лога удаляются, чтобы виджет не разрастался
 
-    def flush(self):
-        pass
+# Оставшееся время в виде "1 ч 5 мин", "3 мин 20 с" или "15 с"
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds} с"
 
-class TextHandler(logging.Handler):
-    def __init__(self, text_widget):
-        super().__init__()
-        self.text_widget = text_widget
+# Подпись прогресса задания для таблицы: "Запись GeoJSON 45%, ~3 мин 20 с"
+def format_job_progress(job):
+    if job.status != RUNNING or job.stage is None:
+        return f"{job.fraction:.0%}" if job.status == DONE else ''
+    text = f"{STAGE_TITLES.get(job.stage, job.stage)} {job.fraction:.0%}"
+    if job.eta is not None:
+        text += f", ~{format_eta(job.eta)}"
+    return text
 
-    def emit(self, record):
-        msg = self.format(record)
-        try:
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert(tk.END, msg + '\n')
-            self.text_widget.see(tk.END)
-            self.text_widget.configure(state='disabled')
-        except Exception:
-            pass  # Виджет уже уничтожен
 
 class GeojsonGUI(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("XML to GeoJSON Converter")
-        self.geometry("720x540")
+        self.geometry("760x800")
         self.resizable(False, False)
         self.configure(bg="#f4f6fa")
 
@@ -55,17 +61,34 @@ class GeojsonGUI(tk.Tk):
         style.configure('TFrame', background="#f4f6fa")
         style.configure('TProgressbar', thickness=8)
 
-        self.input_file = tk.StringVar()
         self.voltage_file = tk.StringVar()
-        self.output_file = tk.StringVar(value="output.geojson")
+        self.output_dir = tk.StringVar(value=os.getcwd())
         self.status = tk.StringVar(value="Ожидание")
+        self.filial = tk.StringVar()
+        self.min_voltage = tk.StringVar()
+        self.max_voltage = tk.StringVar()
+        self.line = tk.StringVar()
+        self.bbox = tk.StringVar()
 
-        # Входной XML
-        ttk.Label(self, text="Входной XML-файл:").pack(anchor='w', padx=16, pady=(16,0))
-        frame1 = ttk.Frame(self)
-        frame1.pack(fill='x', padx=16)
-        ttk.Entry(frame1, textvariable=self.input_file, width=60).pack(side='left', fill='x', expand=True)
-        ttk.Button(frame1, text="Выбрать...", command=self.browse_input).pack(side='left', padx=6)
+        # Очередь входных XML
+        ttk.Label(self, text="Входные XML-файлы:").pack(anchor='w', padx=16, pady=(16,0))
+        jobs_frame = ttk.Frame(self)
+        jobs_frame.pack(fill='x', padx=16)
+        self.jobs_view = ttk.Treeview(jobs_frame, columns=('file', 'status', 'progress'), show='headings', height=7)
+        self.jobs_view.heading('file', text="Файл")
+        self.jobs_view.heading('status', text="Состояние")
+        self.jobs_view.heading('progress', text="Прогресс")
+        self.jobs_view.column('file', width=300)
+        self.jobs_view.column('status', width=110)
+        self.jobs_view.column('progress', width=200)
+        self.jobs_view.pack(side='left', fill='x', expand=True)
+        jobs_scroll = ttk.Scrollbar(jobs_frame, orient='vertical', command=self.jobs_view.yview)
+        jobs_scroll.pack(side='left', fill='y')
+        self.jobs_view.configure(yscrollcommand=jobs_scroll.set)
+        jobs_buttons = ttk.Frame(self)
+        jobs_buttons.pack(fill='x', padx=16, pady=(6,0))
+        ttk.Button(jobs_buttons, text="Добавить файлы...", command=self.browse_input).pack(side='left')
+        ttk.Button(jobs_buttons, text="Удалить", command=self.remove_jobs).pack(side='left', padx=6)
 
         # Классы напряжения
         ttk.Label(self, text="Файл классов напряжения:").pack(anchor='w', padx=16, pady=(12,0))
@@ -74,21 +97,40 @@ class GeojsonGUI(tk.Tk):
         ttk.Entry(frame2, textvariable=self.voltage_file, width=60).pack(side='left', fill='x', expand=True)
         ttk.Button(frame2, text="Выбрать...", command=self.browse_voltage).pack(side='left', padx=6)
 
-        # Выходной файл
-        ttk.Label(self, text="Имя выходного файла:").pack(anchor='w', padx=16, pady=(12,0))
+        # Каталог результатов: <имя входного файла>.geojson и лог опор без координат
+        ttk.Label(self, text="Каталог для GeoJSON:").pack(anchor='w', padx=16, pady=(12,0))
         frame3 = ttk.Frame(self)
         frame3.pack(fill='x', padx=16)
-        ttk.Entry(frame3, textvariable=self.output_file, width=60).pack(side='left', fill='x', expand=True)
-        ttk.Button(frame3, text="Сохранить как...", command=self.browse_output).pack(side='left', padx=6)
+        ttk.Entry(frame3, textvariable=self.output_dir, width=60).pack(side='left', fill='x', expand=True)
+        ttk.Button(frame3, text="Выбрать...", command=self.browse_output).pack(side='left', padx=6)
+
+        # Фильтры выборки (необязательные)
+        ttk.Label(self, text="Фильтры (необязательно):").pack(anchor='w', padx=16, pady=(12,0))
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill='x', padx=16)
+        ttk.Label(filter_frame, text="Филиал (Ref):").grid(row=0, column=0, sticky='w')
+        ttk.Entry(filter_frame, textvariable=self.filial, width=38).grid(row=0, column=1, sticky='w', padx=6)
+        ttk.Label(filter_frame, text="кВ от").grid(row=0, column=2, sticky='w')
+        ttk.Entry(filter_frame, textvariable=self.min_voltage, width=6).grid(row=0, column=3, padx=4)
+        ttk.Label(filter_frame, text="до").grid(row=0, column=4, sticky='w')
+        ttk.Entry(filter_frame, textvariable=self.max_voltage, width=6).grid(row=0, column=5, padx=4)
+        ttk.Label(filter_frame, text="ЛЭП (Ref/гуид):").grid(row=1, column=0, sticky='w', pady=(4,0))
+        ttk.Entry(filter_frame, textvariable=self.line, width=38).grid(row=1, column=1, sticky='w', padx=6, pady=(4,0))
+        ttk.Label(filter_frame, text="Область (мин. долгота, мин. широта, макс. долгота, макс. широта):").grid(
+            row=2, column=0, columnspan=6, sticky='w', pady=(4,0))
+        ttk.Entry(filter_frame, textvariable=self.bbox, width=60).grid(row=3, column=0, columnspan=6, sticky='w')
 
-        # Кнопка запуска и прогресс-бар
+        # Кнопки запуска, отмены и повтора, общий прогресс
         btn_frame = ttk.Frame(self)
         btn_frame.pack(fill='x', padx=16, pady=(16,0))
         self.run_btn = ttk.Button(btn_frame, text="Запустить парсинг", command=self.run_parser)
         self.run_btn.pack(side='left')
-        self.progress = ttk.Progressbar(btn_frame, mode='indeterminate', length=180)
+        self.cancel_btn = ttk.Button(btn_frame, text="Отменить", command=self.cancel_parser)
+        self.cancel_btn.pack(side='left', padx=(6, 0))
+        self.retry_btn = ttk.Button(btn_frame, text="Повторить", command=self.retry_jobs)
+        self.retry_btn.pack(side='left', padx=(6, 0))
+        self.progress = ttk.Progressbar(btn_frame, mode='determinate', maximum=100, length=160)
         self.progress.pack(side='left', padx=16)
-        self.progress.stop()
 
         # Статус
         self.status_label = ttk.Label(self, textvariable=self.status, font=("Segoe UI", 10, "italic"), foreground="#3b82f6")
@@ -96,25 +138,23 @@ class GeojsonGUI(tk.Tk):
 
         # Лог
         ttk.Label(self, text="Лог выполнения:").pack(anchor='w', padx=16, pady=(12,0))
-        self.log_text = scrolledtext.ScrolledText(self, height=13, state='disabled', font=("Consolas", 10), bg="#f8fafc")
+        self.log_text = scrolledtext.ScrolledText(self, height=12, state='disabled', font=("Consolas", 10), bg="#f8fafc")
         self.log_text.pack(fill='both', expand=True, padx=16, pady=(0,14))
 
-        # Логгер для logging
-        self.text_handler = TextHandler(self.log_text)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        self.text_handler.setFormatter(formatter)
-        logging.getLogger().addHandler(self.text_handler)
+        # Задания выполняются в пуле процессов; их логи и прогресс, как и logging
+        # самого GUI, приходят через очередь сообщений и выводятся в _poll_jobs
+        self.jobs = JobQueue()
+        self.log_handler = QueueLogHandler(self.jobs.messages)
+        logging.getLogger().addHandler(self.log_handler)
         logging.getLogger().setLevel(logging.INFO)
-
-        # Оставляем перенаправление только для print (если нужно)
-        sys.stdout = RedirectText(self.log_text)
-        sys.stderr = RedirectText(self.log_text)
         self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(POLL_MS, self._poll_jobs)
 
     def browse_input(self):
-        file = filedialog.askopenfilename(filetypes=[("XML files", "*.xml"), ("All files", "*.*")])
-        if file:
-            self.input_file.set(file)
+        files = filedialog.askopenfilenames(filetypes=[("XML files", "*.xml"), ("All files", "*.*")])
+        for file in files:
+            job = self.jobs.add(file, None, None)
+            self.jobs_view.insert('', 'end', iid=str(job.id), values=(os.path.basename(file), job.status, ''))
 
     def browse_voltage(self):
         file = filedialog.askopenfilename(filetypes=[("XML files", "*.xml"), ("All files", "*.*")])
@@ -122,39 +162,131 @@ class GeojsonGUI(tk.Tk):
             self.voltage_file.set(file)
 
     def browse_output(self):
-        file = filedialog.asksaveasfilename(defaultextension=".geojson", filetypes=[("GeoJSON", "*.geojson"), ("All files", "*.*")])
-        if file:
-            self.output_file.set(file)
+        directory = filedialog.askdirectory(initialdir=self.output_dir.get() or None)
+        if directory:
+            self.output_dir.set(directory)
+
+    # Фильтры выборки из полей формы в виде аргументов process_xml_to_geojson
+    def read_filters(self):
+        filters = {}
+        if self.filial.get().strip():
+            filters['filial'] = self.filial.get().strip()
+        if self.line.get().strip():
+            filters['line'] = self.line.get().strip()
+        for name, var in (('min_voltage', self.min_voltage), ('max_voltage', self.max_voltage)):
+            if var.get().strip():
+                filters[name] = float(var.get().strip().replace(',', '.'))
+        if self.bbox.get().strip():
+            bbox = tuple(float(value) for value in self.bbox.get().replace(';', ',').split(','))
+            if len(bbox) != 4:
+                raise ValueError("Область задаётся четырьмя числами")
+            filters['bbox'] = bbox
+        return filters
+
+    # Выделенные в таблице задания; если ничего не выделено — все
+    def selected_jobs(self):
+        ids = self.jobs_view.selection() or self.jobs_view.get_children()
+        return [self.jobs.jobs[int(iid)] for iid in ids]
 
+    # Запуск всех ещё не запускавшихся заданий с текущими классами напряжения, каталогом и фильтрами
     def run_parser(self):
-        input_path = self.input_file.get()
         voltage_path = self.voltage_file.get()
-        output_path = self.output_file.get()
-        if not input_path or not voltage_path or not output_path:
-            messagebox.showerror("Ошибка", "Пожалуйста, выберите все файлы и имя выходного файла.")
+        output_dir = self.output_dir.get()
+        waiting = [job for job in self.jobs.jobs.values() if job.status == PENDING and job.future is None]
+        if not waiting or not voltage_path or not output_dir:
+            messagebox.showerror("Ошибка", "Пожалуйста, добавьте входные файлы, выберите классы напряжения и каталог.")
             return
-        self.status.set("Выполняется...")
-        self.progress.start(10)
-        self.run_btn.config(state='disabled')
-        threading.Thread(target=self._run_parser_thread, args=(input_path, voltage_path, output_path), daemon=True).start()
-
-    def _run_parser_thread(self, input_path, voltage_path, output_path):
         try:
-            print(f"Запуск парсинга...\nВходной файл: {input_path}\nКлассы напряжения: {voltage_path}\nВыходной файл: {output_path}\n")
-            process_xml_to_geojson(input_path, voltage_path, output_path)
-            print("\nГотово! ✅")
-            self.status.set("Готово!")
-        except Exception as e:
-            print(f"\nОшибка: {e}")
-            self.status.set("Ошибка!")
-        finally:
-            self.progress.stop()
-            self.run_btn.config(state='normal')
+            filters = self.read_filters()
+        except ValueError as e:
+            messagebox.showerror("Ошибка", f"Неверное значение фильтра: {e}")
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        # Выгрузки часто называются одинаково (ЛЭП.xml из разных каталогов, один файл
+        # добавлен дважды) — такие задания получают суффикс с номером задания
+        def target(name):
+            return os.path.normcase(os.path.abspath(os.path.join(output_dir, name + '.geojson')))
+
+        taken = {os.path.normcase(os.path.abspath(job.output_file))
+                 for job in self.jobs.jobs.values() if job.output_file is not None and job not in waiting}
+        for job in waiting:
+            base = name = os.path.splitext(os.path.basename(job.input_file))[0]
+            suffix = job.id
+            while target(name) in taken:
+                name = f"{base}_{suffix}"
+                suffix += 1
+            taken.add(target(name))
+            job.voltage_file = voltage_path
+            job.output_file = os.path.join(output_dir, name + '.geojson')
+            job.options = dict(filters, log_file=os.path.join(output_dir, name + '_missing_coordinates.log'))
+            if filters:
+                logging.info("Фильтры для %s: %s", name, filters)
+        self.jobs.start_pending()
+        self._refresh_jobs(waiting)
+
+    def cancel_parser(self):
+        jobs = [job for job in self.selected_jobs() if job.status not in FINISHED]
+        for job in jobs:
+            self.jobs.cancel(job)
+        self._refresh_jobs(jobs)
+        if jobs:
+            self.status.set("Отмена...")
+
+    def retry_jobs(self):
+        jobs = [job for job in self.selected_jobs() if job.status in (FAILED, CANCELLED)]
+        for job in jobs:
+            if job.output_file is None:
+                # Отменено до запуска — параметры ещё не заданы, задание просто возвращается в очередь
+                job.status = PENDING
+            else:
+                self.jobs.retry(job)
+        self._refresh_jobs(jobs)
+
+    def remove_jobs(self):
+        for iid in self.jobs_view.selection():
+            if self.jobs.remove(self.jobs.jobs[int(iid)]):
+                self.jobs_view.delete(iid)
+
+    def _refresh_jobs(self, jobs):
+        for job in jobs:
+            if self.jobs_view.exists(str(job.id)):
+                status = job.status if job.status in (PENDING, RUNNING, DONE) or not job.detail else f"{job.status}: {job.detail}"
+                self.jobs_view.item(str(job.id), values=(os.path.basename(job.input_file), status,
+                                                         format_job_progress(job)))
+
+    # Опрос очереди сообщений в потоке Tk: строки лога выводятся одной вставкой,
+    # таблица и общий прогресс обновляются только для изменившихся заданий
+    def _poll_jobs(self):
+        lines, changed = self.jobs.poll()
+        if lines:
+            self.log_text.configure(state='normal')
+            self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - MAX_LOG_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+            self.log_text.configure(state='disabled')
+        if changed:
+            self._refresh_jobs(changed)
+        started = [job for job in self.jobs.jobs.values() if job.future is not None]
+        if started and (changed or lines):
+            counts = {state: sum(job.status == state for job in started) for state in (RUNNING, PENDING, DONE, FAILED, CANCELLED)}
+            self.progress['value'] = sum(job.fraction for job in started) / len(started) * 100
+            if counts[RUNNING] or counts[PENDING]:
+                self.status.set(f"Выполняется: {counts[RUNNING]}, в очереди: {counts[PENDING]}, готово: {counts[DONE]} из {len(started)}")
+            else:
+                self.status.set(f"Завершено: готово {counts[DONE]}, ошибок {counts[FAILED]}, отменено {counts[CANCELLED]}")
+        self.after(POLL_MS, self._poll_jobs)
 
     def on_close(self):
-        logging.getLogger().removeHandler(self.text_handler)
+        if self.jobs.active():
+            self.status.set("Отмена заданий...")
+            self.update_idletasks()
+        self.jobs.shutdown()
+        logging.getLogger().removeHandler(self.log_handler)
         self.destroy()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Рабочие процессы в exe, собранном pyinstaller
     app = GeojsonGUI()
     app.mainloop()
@@ -0,0 +1,421 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from operator import attrgetter
+
+from final_xml_to_geojsonn import (
+    FEATURE_BUILDERS, OBJECT_TAG, NetworkObject, NetworkStore, iter_feature_order, iter_network_objects,
+    parse_voltage_classes, validate_network,
+)
+from geojson_writer import open_geojson_writer, open_text_sink
+
+# Инкрементальная (дельта) конвертация между последовательными выгрузками.
+# Файл состояния хранит с прошлого запуска хэш выгрузки и для каждого Ref — хэш
+# содержимого объекта, его связь (Parent / гуид), а если объект попал в вывод — смещение
+# и длину его фрагмента в прошлом выводе и хэш текста; рядом лежит кэш разобранных полей
+# объектов по хэшу их байтов в выгрузке. Не изменившаяся выгрузка не разбирается вовсе.
+# Иначе она разбивается на объекты поиском тегов без разбора XML, разбираются только
+# объекты с новыми байтами, остальные берутся из кэша. Заново строятся и кодируются только объекты, которые изменились
+# сами или зависят от изменившихся (опора -> пролеты -> участок -> ЛЭП), остальные
+# фрагменты копируются из прошлого вывода диапазонами байтов без разбора и кодирования.
+
+STATE_VERSION = 3
+COPY_BLOCK = 2 ** 20  # Размер блока чтения и передачи готовых байтов писателю
+
+OBJECT_START = f'<{OBJECT_TAG}'.encode('utf-8')
+OBJECT_END = f'</{OBJECT_TAG}>'.encode('utf-8')
+TAG_NAME_END = (b'>', b'/', b' ', b'\t', b'\r', b'\n')  # Символы после имени тега
+PARSE_LIMIT = 64 * 2 ** 20  # Изменённых объектов больше — выгрузка разбирается целиком
+
+object_fields = attrgetter(*NetworkObject.__slots__)
+
+def text_hash(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+# Хэш файла целиком, читается блоками
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Хэш классов напряжения: при их изменении пересобираются все features
+def voltage_classes_hash(voltage_classes):
+    text = json.dumps(voltage_classes, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+# Разбиение выгрузки на байты объектов без разбора XML: (заголовок до первого объекта,
+# окончание после последнего, хэши объектов по порядку, байты объектов с хэшами не из known
+# или None, если их больше limit). Объекты выгрузки 1С лежат подряд внутри Data; если это
+# не так (вложенные объекты, другая разметка между ними), возвращается None
+def scan_export(input_file, known, limit=PARSE_LIMIT):
+    hashes, changed = [], []
+    changed_size = 0
+    head = None
+    rest = b''
+    with open(input_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BLOCK), b''):
+            pieces = (rest + chunk).split(OBJECT_END)
+            rest = pieces.pop()
+            for piece in pieces:
+                if head is None:
+                    start = piece.find(OBJECT_START)
+                    head, piece = piece[:start], piece[start:]
+                else:
+                    piece = piece.lstrip()
+                if (not piece.startswith(OBJECT_START) or piece.find(OBJECT_START, 1) >= 0
+                        or piece[len(OBJECT_START):len(OBJECT_START) + 1] not in TAG_NAME_END):
+                    return None
+                digest = text_hash(piece)
+                hashes.append(digest)
+                if changed is not None and digest not in known:
+                    changed.append(piece + OBJECT_END)
+                    changed_size += len(piece)
+                    if changed_size > limit:
+                        changed = None
+    if head is None or OBJECT_START in rest:
+        return None
+    return head, rest, hashes, changed
+
+# Загрузка хранилища с кэшем разобранных объектов прошлого запуска ({'version', 'head': хэш
+# заголовка выгрузки, 'records': хэш байтов объекта -> кортеж его полей}). Разбираются только
+# объекты, которых нет в кэше; если их слишком много, выгрузка читается целиком.
+# Возвращает (хранилище, Ref -> хэш байтов объекта, новый кэш); хэши None, если
+# структура выгрузки не позволяет разбить её на объекты без разбора
+def load_network_cached(input_file, cache=None):
+    try:
+        scanned = scan_export(input_file, cache['records'] if cache else {})
+        if scanned is None:
+            hash_by_ref, new_cache = None, None
+            store = NetworkStore.from_objects(iter_network_objects(input_file))
+        else:
+            head, tail, hashes, changed = scanned
+            records = cache['records'] if cache and cache['head'] == text_hash(head) else {}
+            if not records:
+                changed = None
+            hash_by_ref = {}
+            new_cache = {'version': STATE_VERSION, 'head': text_hash(head), 'records': {}}
+            logging.info("Разбирается %s объектов из %d",
+                         'все' if changed is None else len(changed), len(hashes))
+            store = NetworkStore.from_objects(
+                iter_cached_objects(input_file, head, tail, hashes, changed, records, hash_by_ref,
+                                    new_cache['records']))
+            if changed == [] and len(new_cache['records']) == len(records):
+                new_cache = cache  # Тот же набор объектов — кэш не переписывается
+    except FileNotFoundError:
+        logging.error("Файл '%s' не найден.", input_file)
+        return None
+    except ET.ParseError:
+        logging.error("Ошибка парсинга '%s'.", input_file)
+        return None
+    logging.info("Спарсено %d объектов из '%s'", store.object_count, input_file)
+    logging.info("Найдено %d ЛЭП, %d участков, %d пролетов, %d опор",
+                 len(store.lines), len(store.sections), len(store.spans), len(store.supports))
+    return store, hash_by_ref, new_cache
+
+# Объекты выгрузки по порядку: из кэша или разобранные (только изменённые байты с заголовком
+# и окончанием выгрузки, либо вся выгрузка, если changed None). Попутно заполняет
+# Ref -> хэш (при повторе Ref побеждает последний объект, как в хранилище) и новый кэш
+def iter_cached_objects(input_file, head, tail, hashes, changed, records, hash_by_ref, new_records):
+    if changed is None:
+        records = {}
+        parsed = iter_network_objects(input_file)
+    else:
+        parsed = iter_network_objects(io.BytesIO(b''.join([head, *changed, tail])))
+    for digest in hashes:
+        fields = records.get(digest)
+        if fields is not None:
+            obj = NetworkObject(*fields)
+        else:
+            obj = next(parsed, None)
+            if obj is None:
+                raise ValueError("Объектов в выгрузке меньше, чем найдено при разбиении на объекты")
+            fields = object_fields(obj)
+        new_records[digest] = fields
+        hash_by_ref[obj.ref] = digest
+        yield obj
+    if next(parsed, None) is not None:
+        raise ValueError("Объектов в выгрузке больше, чем найдено при разбиении на объекты")
+
+# Загрузка состояния прошлого запуска (None, если его нет или оно другой версии)
+def load_state(state_file):
+    if not state_file or not os.path.exists(state_file):
+        return None
+    opener = gzip.open if str(state_file).endswith('.gz') else open
+    try:
+        with opener(state_file, 'rt', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        logging.warning("Файл состояния '%s' повреждён, выполняется полная конвертация", state_file)
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+# Кэш разобранных объектов лежит рядом с файлом состояния в pickle: он в несколько раз
+# быстрее JSON для сотен тысяч кортежей, а читается только из собственного файла конвертера
+def cache_file_for(state_file):
+    return f"{state_file}.cache"
+
+def load_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+    except Exception:
+        logging.warning("Кэш объектов '%s' повреждён, выгрузка разбирается целиком", cache_file)
+        return None
+    return cache if isinstance(cache, dict) and cache.get('version') == STATE_VERSION else None
+
+def save_cache(cache, cache_file):
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+# Атомарная запись состояния: сначала во временный файл, затем замена
+def save_state(state, state_file):
+    tmp_file = f"{state_file}.tmp"
+    with open_text_sink(tmp_file, str(state_file).endswith('.gz')) as f:
+        # json.dumps целиком — кодировщик на C; json.dump в файл кодирует на Python по частям
+        f.write(json.dumps(state, ensure_ascii=False, separators=(',', ':')))
+    os.replace(tmp_file, state_file)
+
+# Снимок объектов хранилища: Ref -> [хэш, вид, связь с родителем]; для объектов,
+# попавших в вывод, к записи добавляются [смещение, длина, хэш текста] фрагмента.
+# Хэш — хэш байтов объекта в выгрузке (hash_by_ref); у участков и ЛЭП к нему добавляется
+# упорядоченный список Ref дочерних объектов (от порядка пролетов зависят relations и геометрия)
+def snapshot_objects(store, hash_by_ref):
+    def with_children(digest, children):
+        return text_hash(','.join([digest, *children]).encode('utf-8'))
+
+    objects = {}
+    for obj in store.supports:
+        objects[obj.ref] = [hash_by_ref[obj.ref], 'pylons', None]
+    for obj in store.spans:
+        objects[obj.ref] = [hash_by_ref[obj.ref], 'span', obj.parent]
+    for obj in store.sections:
+        children = [store.spans[j].ref for j in store.spans_by_section.get(obj.ref, ())]
+        objects[obj.ref] = [with_children(hash_by_ref[obj.ref], children), 'lines', obj.parent]
+    for obj in store.lines:
+        children = [store.sections[j].ref for j in store.sections_by_line.get(obj.guid, ())]
+        objects[obj.ref] = [with_children(hash_by_ref[obj.ref], children), 'fulllines', obj.guid]
+    return objects
+
+# Множества Ref объектов, чьи features нужно построить заново
+def find_dirty_refs(store, objects, previous_objects):
+    changed = {ref for ref, entry in objects.items()
+               if ref not in previous_objects or previous_objects[ref][0] != entry[0]}
+    removed = previous_objects.keys() - objects.keys()
+    touched = changed | removed
+
+    dirty = {obj.ref for obj in store.supports if obj.ref in changed}
+
+    # Пролет зависит от своих опор
+    dirty_spans = [obj for obj in store.spans
+                   if obj.ref in changed or obj.start in touched or obj.end in touched]
+    dirty.update(obj.ref for obj in dirty_spans)
+
+    # Участок зависит от своих пролетов, в том числе ушедших к другому участку или удалённых
+    section_refs = {obj.parent for obj in dirty_spans}
+    section_refs.update(previous_objects[ref][2] for ref in touched
+                        if ref in previous_objects and previous_objects[ref][1] == 'span')
+    dirty_sections = [obj for obj in store.sections if obj.ref in changed or obj.ref in section_refs]
+    dirty.update(obj.ref for obj in dirty_sections)
+
+    # ЛЭП зависит от участков со своим гуид
+    line_guids = {obj.parent for obj in dirty_sections}
+    line_guids.update(previous_objects[ref][2] for ref in touched
+                      if ref in previous_objects and previous_objects[ref][1] == 'lines')
+    dirty.update(obj.ref for obj in store.lines if obj.ref in changed or obj.guid in line_guids)
+    return dirty
+
+# Метка файла вывода: прошлый вывод годится для копирования, только если он не менялся
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Прошлый вывод для чтения фрагментов по смещениям. Сжатый распаковывается один раз во
+# временный файл: seek назад в gzip заново распаковывает поток с начала
+def open_previous_output(output_file, compress):
+    if not compress:
+        return open(output_file, 'rb')
+    previous = tempfile.TemporaryFile()
+    with gzip.open(output_file, 'rb') as f:
+        shutil.copyfileobj(f, previous, COPY_BLOCK)
+    return previous
+
+# Сборка нового вывода из фрагментов прошлого вывода (соседние копируются одним
+# диапазоном байтов) и заново сериализованных; запоминает новые смещения фрагментов
+class FragmentCopier:
+    def __init__(self, writer, previous):
+        self.writer = writer
+        self.previous = previous
+        self.separator = writer.separator.encode('utf-8')
+        self.features = {}
+        self.block = bytearray()
+        self.entries = []  # (Ref, смещение в блоке, длина, хэш)
+        self.run = None  # [начало, конец, фрагменты] диапазона прошлого вывода
+
+    # Неизменённый фрагмент прошлого вывода
+    def copy(self, ref, offset, length, digest):
+        run = self.run
+        if run is not None and offset == run[1] + len(self.separator) and run[1] - run[0] < COPY_BLOCK:
+            run[2].append((ref, offset - run[0], length, digest))
+            run[1] = offset + length
+            return
+        self.end_run()
+        self.run = [offset, offset + length, [(ref, 0, length, digest)]]
+
+    # Заново сериализованный фрагмент
+    def write(self, ref, data, digest):
+        self.end_run()
+        self.add(data, [(ref, 0, len(data), digest)])
+
+    def end_run(self):
+        if self.run is None:
+            return
+        start, end, entries = self.run
+        self.run = None
+        self.previous.seek(start)
+        data = self.previous.read(end - start)
+        if len(data) != end - start:
+            raise ValueError("Прошлый вывод короче, чем записано в состоянии")
+        self.add(data, entries)
+
+    def add(self, data, entries):
+        if self.entries:
+            self.block += self.separator
+        base = len(self.block)
+        self.block += data
+        self.entries.extend((ref, base + offset, length, digest) for ref, offset, length, digest in entries)
+        if len(self.block) >= COPY_BLOCK:
+            self.flush()
+
+    def flush(self):
+        if not self.entries:
+            return
+        offset = self.writer.write_fragments(bytes(self.block), len(self.entries))
+        for ref, block_offset, length, digest in self.entries:
+            self.features[ref] = [offset + block_offset, length, digest]
+        self.block = bytearray()
+        self.entries = []
+
+    def close(self):
+        self.end_run()
+        self.flush()
+
+def write_diff(diff, diff_file):
+    with open(diff_file, 'w', encoding='utf-8') as f:
+        json.dump(diff, f, ensure_ascii=False, indent=2)
+    logging.info("Diff записан в '%s'", diff_file)
+
+# Инкрементальная конвертация: результат тот же, что у process_xml_to_geojson,
+# плюс diff добавленных/изменённых/удалённых features (возвращается и пишется в diff_file)
+def process_xml_to_geojson_incremental(input_file, voltage_file='Классы_напряжения.xml', output_file='output.geojson',
+                                       log_file='missing_coordinates.log', state_file='output.state.json',
+                                       diff_file=None, output_format='geojson', compact=False, compress=None):
+    voltage_classes = parse_voltage_classes(voltage_file)
+    if compress is None:
+        compress = str(output_file).endswith('.gz')
+    settings = {'voltage_classes': voltage_classes_hash(voltage_classes),
+                'output_format': output_format, 'compact': bool(compact), 'compress': bool(compress)}
+    try:
+        input_hash = file_hash(input_file)
+    except FileNotFoundError:
+        logging.error("Файл '%s' не найден.", input_file)
+        return None
+
+    state = load_state(state_file)
+    reusable = (state is not None and state['settings'] == settings
+                and state['output'] == file_stamp(output_file))
+    if reusable and state['input'] == input_hash and os.path.exists(log_file):
+        logging.info("Выгрузка '%s' не изменилась, '%s' актуален", input_file, output_file)
+        diff = {'added': [], 'changed': [], 'removed': []}
+        if diff_file:
+            write_diff(diff, diff_file)
+        return diff
+
+    cache_file = cache_file_for(state_file)
+    previous_cache = load_cache(cache_file)
+    loaded = load_network_cached(input_file, previous_cache)
+    if loaded is None:
+        return None
+    store, hash_by_ref, cache = loaded
+    validate_network(store, log_file)
+
+    previous_objects = state['objects'] if state is not None else {}
+    objects = None
+    dirty = None
+    if hash_by_ref is None:
+        logging.warning("Объекты в '%s' не лежат подряд, как в выгрузке 1С: инкрементальный режим "
+                        "недоступен, выполняется полная конвертация", input_file)
+    else:
+        objects = snapshot_objects(store, hash_by_ref)
+    if objects is not None and reusable:
+        dirty = find_dirty_refs(store, objects, previous_objects)
+        logging.info("Инкрементальный режим: %d из %d объектов требуют пересборки", len(dirty), len(objects))
+    elif objects is not None and state is not None:
+        logging.info("Параметры конвертации или вывод '%s' изменились после прошлого запуска, "
+                     "выполняется полная пересборка", output_file)
+
+    diff = {'added': [], 'changed': [], 'removed': []}
+    with open_geojson_writer(output_file, output_format, compact, compress) as writer:
+        previous = None
+        if dirty is not None:
+            previous = open_previous_output(output_file, compress)
+        try:
+            copier = FragmentCopier(writer, previous)
+            for kind, i in iter_feature_order(store):
+                ref = store.object_at(kind, i).ref
+                entry = previous_objects.get(ref)
+                emitted = entry is not None and len(entry) > 3  # Фрагмент есть в прошлом выводе
+                if emitted and dirty is not None and ref not in dirty:
+                    copier.copy(ref, entry[3], entry[4], entry[5])
+                    continue
+                data = writer.encode(FEATURE_BUILDERS[kind](store, i, voltage_classes)).encode('utf-8')
+                digest = text_hash(data)
+                if not emitted:
+                    diff['added'].append(ref)
+                elif entry[5] != digest:
+                    diff['changed'].append(ref)
+                copier.write(ref, data, digest)
+            copier.close()
+        finally:
+            if previous is not None:
+                previous.close()
+    diff['removed'] = [ref for ref, entry in previous_objects.items()
+                       if len(entry) > 3 and ref not in copier.features]
+    logging.info("GeoJSON записан в '%s' с %d features", output_file, writer.count)
+    logging.info("Изменения: %d добавлено, %d изменено, %d удалено",
+                 len(diff['added']), len(diff['changed']), len(diff['removed']))
+
+    if objects is not None:
+        for ref, fragment in copier.features.items():
+            objects[ref].extend(fragment)
+        save_state({'version': STATE_VERSION, 'settings': settings, 'input': input_hash,
+                    'output': file_stamp(output_file), 'objects': objects}, state_file)
+        if cache is not previous_cache:
+            save_cache(cache, cache_file)
+    else:
+        for path in (state_file, cache_file):
+            if os.path.exists(path):
+                os.remove(path)
+    if diff_file:
+        write_diff(diff, diff_file)
+    return diff
+
+if __name__ == "__main__":
+    process_xml_to_geojson_incremental('ЛЭП.xml', diff_file='output.diff.json')
@@ -1,51 +1,139 @@
-import xml.etree.ElementTree as ET
-import uuid
-from collections import defaultdict
+import argparse
+import gzip
+import json
 import os
+import xml.etree.ElementTree as ET
+
+from final_xml_to_geojsonn import GUID_OPORA, GUID_PROLET, GUID_UCHASTOK, GUID_VL_LEP, iter_object_elements
+
+# Разделение выгрузки на файлы по видам технических мест за один потоковый проход:
+# каждый объект записывается в файл своей группы сразу после чтения, поэтому память
+# не зависит от размера выгрузки. Файлы группы можно ограничить числом объектов или
+# размером (шарды) и сжимать gzip.
 
-# Словарь для соответствия GUID и групп
-groups = {
-    'c0c2ac9d-fcee-11e1-8837-20cf30e80dd7': {'name': 'ВЛ_ЛЭП', 'count': 0, 'objects': []},
-    'c0c2ad20-fcee-11e1-8837-20cf30e80dd7': {'name': 'Участок_магистрали', 'count': 0, 'objects': []},
-    'c0c2acd0-fcee-11e1-8837-20cf30e80dd7': {'name': 'Пролет', 'count': 0, 'objects': []},
-    'c0c2aca6-fcee-11e1-8837-20cf30e80dd7': {'name': 'Опора', 'count': 0, 'objects': []}
+# Соответствие GUID вида технического места и группы (по умолчанию — четыре вида сети)
+DEFAULT_GROUPS = {
+    GUID_VL_LEP: 'ВЛ_ЛЭП',
+    GUID_UCHASTOK: 'Участок_магистрали',
+    GUID_PROLET: 'Пролет',
+    GUID_OPORA: 'Опора',
 }
 
-def process_xml_file(input_file):
-    # Парсинг XML файла
-    tree = ET.parse(input_file)
-    root = tree.getroot()
-    
-    # Проходим по всем объектам CatalogObject.урскСтруктураСети
-    for obj in root.findall('.//CatalogObject.урскСтруктураСети'):
-        vid_teh_mesta = obj.find('ВидТехническогоМеста').text if obj.find('ВидТехническогоМеста') is not None else None
-        
-        # Если GUID соответствует одной из групп, добавляем объект в соответствующую группу
-        if vid_teh_mesta in groups:
-            groups[vid_teh_mesta]['count'] += 1
-            groups[vid_teh_mesta]['objects'].append(obj)
-    
-    # Создаем отдельные XML файлы для каждой группы
-    for guid, group_info in groups.items():
-        if group_info['objects']:
-            # Создаем новый XML документ
-            new_root = ET.Element('root')
-            for obj in group_info['objects']:
-                new_root.append(obj)
-            
-            # Создаем дерево и записываем в файл
-            new_tree = ET.ElementTree(new_root)
-            output_file = f'output_{group_info["name"]}.xml'
-            new_tree.write(output_file, encoding='utf-8', xml_declaration=True)
-    
+XML_HEADER = b"<?xml version='1.0' encoding='utf-8'?>\n<root>"
+XML_FOOTER = b"</root>"
+
+# Файлы одной группы: output_<группа>.xml, а при ограничении размера —
+# output_<группа>_001.xml, output_<группа>_002.xml, ...; с compress к имени добавляется .gz
+class GroupWriter:
+    def __init__(self, name, output_dir='.', max_objects=None, max_bytes=None, compress=False):
+        self.name = name
+        self.output_dir = output_dir
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.count = 0
+        self.files = []
+        self.file = None
+        self.shard_objects = 0
+        self.shard_bytes = 0
+
+    def _open_shard(self):
+        sharded = self.max_objects is not None or self.max_bytes is not None
+        suffix = f"_{len(self.files) + 1:03d}" if sharded else ''
+        path = os.path.join(self.output_dir, f"output_{self.name}{suffix}.xml")
+        if self.compress:
+            path += '.gz'
+            self.file = gzip.open(path, 'wb')
+        else:
+            self.file = open(path, 'wb')
+        self.files.append(path)
+        self.file.write(XML_HEADER)
+        self.shard_objects = 0
+        self.shard_bytes = len(XML_HEADER) + len(XML_FOOTER)
+
+    def _close_shard(self):
+        if self.file is not None:
+            self.file.write(XML_FOOTER)
+            self.file.close()
+            self.file = None
+
+    # Запись сериализованного объекта; новый шард начинается, когда текущий заполнен
+    # (размер считается до сжатия, объект в шард попадает всегда хотя бы один)
+    def write(self, data):
+        if self.file is not None and self.shard_objects and (
+                (self.max_objects is not None and self.shard_objects >= self.max_objects)
+                or (self.max_bytes is not None and self.shard_bytes + len(data) > self.max_bytes)):
+            self._close_shard()
+        if self.file is None:
+            self._open_shard()
+        self.file.write(data)
+        self.shard_objects += 1
+        self.shard_bytes += len(data)
+        self.count += 1
+
+    def close(self):
+        self._close_shard()
+
+# Запись сериализованного объекта вместе с его исходным хвостом
+def write_with_tail(writer, data, elem):
+    tail = elem.tail or ''
+    writer.write(data + tail.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').encode('utf-8'))
+
+# Потоковое разделение выгрузки по группам. group_map — GUID вида -> имя группы
+# (несколько видов можно направить в одну группу); max_objects/max_bytes — ограничение
+# шарда. Возвращает для каждой группы {'count': объектов, 'files': [файлы]}
+def split_xml_file(input_file, group_map=None, output_dir='.', max_objects=None, max_bytes=None, compress=False):
+    group_map = DEFAULT_GROUPS if group_map is None else group_map
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {name: GroupWriter(name, output_dir, max_objects, max_bytes, compress)
+               for name in dict.fromkeys(group_map.values())}
+    try:
+        # Хвост объекта (текст после закрывающего тега) парсер заполняет только к следующему
+        # событию, поэтому объект пишется на шаг позже — с исходным хвостом, как в выгрузке
+        previous = None
+        for elem in iter_object_elements(input_file):
+            if previous is not None:
+                write_with_tail(*previous)
+            name = group_map.get(elem.findtext('ВидТехническогоМеста'))
+            previous = (writers[name], ET.tostring(elem, encoding='utf-8'), elem) if name is not None else None
+        if previous is not None:
+            write_with_tail(*previous)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {name: {'count': writer.count, 'files': writer.files} for name, writer in writers.items()}
+
+# Загрузка соответствия GUID -> группа из JSON-файла ({"<GUID>": "<группа>", ...})
+def load_group_map(groups_file):
+    with open(groups_file, encoding='utf-8') as f:
+        return json.load(f)
+
+def process_xml_file(input_file, group_map=None, output_dir='.', max_objects=None, max_bytes=None, compress=False):
+    groups = split_xml_file(input_file, group_map, output_dir, max_objects, max_bytes, compress)
+
     # Выводим статистику в консоль
     print("Количество объектов по типам:")
-    for guid, group_info in groups.items():
-        print(f"{group_info['name']}: {group_info['count']}")
+    for name, group_info in groups.items():
+        print(f"{name}: {group_info['count']}")
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description="Разделение выгрузки ЛЭП XML на файлы по видам технических мест")
+    parser.add_argument('input_file', nargs='?', default='ЛЭП.xml', help="Входной XML-файл")
+    parser.add_argument('--groups', help="JSON-файл соответствия GUID вида технического места и группы")
+    parser.add_argument('--output-dir', default='.', help="Каталог для файлов групп")
+    parser.add_argument('--max-objects', type=int, help="Максимум объектов в одном файле группы")
+    parser.add_argument('--max-mb', type=float, help="Максимальный размер одного файла группы в МБ (до сжатия)")
+    parser.add_argument('--gzip', action='store_true', help="Сжимать файлы групп gzip")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_file):
+        print(f"Файл {args.input_file} не найден")
+        return 1
+    group_map = load_group_map(args.groups) if args.groups else None
+    max_bytes = int(args.max_mb * 2 ** 20) if args.max_mb else None
+    process_xml_file(args.input_file, group_map, args.output_dir, args.max_objects, max_bytes, args.gzip)
+    return 0
 
 if __name__ == "__main__":
-    input_file = "ЛЭП.xml"  # Замените на путь к вашему XML файлу
-    if os.path.exists(input_file):
-        process_xml_file(input_file)
-    else:
-        print(f"Файл {input_file} не найден")
\ No newline at end of file
+    raise SystemExit(main())
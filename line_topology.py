@@ -0,0 +1,70 @@
+# Сборка геометрии участков и ЛЭП из пролетов по графу смежности опор.
+# Каждый пролет — ребро между двумя опорами; цепочки проходятся за линейное время:
+# от концевых опор и точек ветвления через опоры степени 2, затем оставшиеся кольца.
+
+# Разбиение рёбер (пары узлов) на цепочки: список пар (узлы цепочки, шаги), где шаг —
+# номер ребра e, пройденного от первого узла ко второму, или ~e при обратном проходе
+def chain_paths(edges):
+    adjacency = {}
+    for e, (a, b) in enumerate(edges):
+        adjacency.setdefault(a, []).append(e)
+        adjacency.setdefault(b, []).append(e)
+    used = bytearray(len(edges))
+
+    def walk(node, e):
+        chain = [node]
+        steps = []
+        while True:
+            used[e] = 1
+            a, b = edges[e]
+            steps.append(e if node == a else ~e)
+            node = b if node == a else a
+            chain.append(node)
+            incident = adjacency[node]
+            if len(incident) != 2:
+                break
+            e = incident[0] if incident[1] == e else incident[1]
+            if used[e]:
+                break
+        return chain, steps
+
+    chains = []
+    # Сначала концы линий, затем точки ветвления — так цепочки начинаются с концевых опор
+    for degree_filter in (lambda d: d == 1, lambda d: d > 2):
+        for node, incident in adjacency.items():
+            if degree_filter(len(incident)):
+                for e in incident:
+                    if not used[e]:
+                        chains.append(walk(node, e))
+    # Оставшиеся рёбра образуют кольца из опор степени 2
+    for e, (a, _) in enumerate(edges):
+        if not used[e]:
+            chains.append(walk(a, e))
+    return chains
+
+# Разбиение рёбер (пары узлов) на упорядоченные цепочки узлов
+def chain_edges(edges):
+    return [chain for chain, _ in chain_paths(edges)]
+
+# Цепочки координат [lon, lat] участка по его валидным пролетам
+def section_chains(store, section_ref):
+    edges = [(store.span_start[j], store.span_end[j]) for j in store.valid_spans_of(section_ref)]
+    return [[store.support_coordinates(node) for node in chain] for chain in chain_edges(edges)]
+
+# Геометрия участка: LineString для одной цепочки, MultiLineString при ветвлении или разрывах
+def section_geometry(store, section_index):
+    chains = section_chains(store, store.sections[section_index].ref)
+    if not chains:
+        return None
+    if len(chains) == 1:
+        return {"type": "LineString", "coordinates": chains[0]}
+    return {"type": "MultiLineString", "coordinates": chains}
+
+# Геометрия ЛЭП: MultiLineString из цепочек всех её валидных участков
+def line_geometry(store, line_index):
+    chains = []
+    for j in store.valid_sections_of(store.lines[line_index]):
+        chains.extend(section_chains(store, store.sections[j].ref))
+    if not chains:
+        return None
+    return {"type": "MultiLineString", "coordinates": chains}
@@ -0,0 +1,168 @@
+import csv
+import json
+import logging
+import sys
+
+import numpy as np
+
+from final_xml_to_geojsonn import load_network
+
+# Проверка качества данных сети целиком: координаты опор и связи пролетов лежат
+# в хранилище массивами, поэтому каждая проверка — несколько операций NumPy над всей
+# сетью сразу, без цикла Python по объектам. Результат — список замечаний, который
+# пишется отчётом JSON или CSV. Модуль требует numpy (pip install numpy).
+
+EARTH_RADIUS_M = 6371008.8
+# Ожидаемая область координат (min_lon, min_lat, max_lon, max_lat) — Поволжье с запасом
+DEFAULT_REGION = (42.0, 49.0, 62.0, 57.0)
+MIN_SPAN_M = 1.0  # Пролет короче — опоры фактически совпадают
+MAX_SPAN_M = 2000.0  # Пролет длиннее — вероятна ошибка в координатах или ссылке на опору
+DUPLICATE_DECIMALS = 7  # Точность сравнения координат при поиске совпадающих опор
+
+# Описания кодов замечаний для отчёта
+ISSUE_TITLES = {
+    'missing_coordinates': "Опора без координат",
+    'swapped_coordinates': "Широта и долгота перепутаны",
+    'out_of_region': "Координаты вне ожидаемой области",
+    'duplicate_coordinates': "Совпадают координаты нескольких опор",
+    'short_span': "Слишком короткий пролет",
+    'long_span': "Слишком длинный пролет",
+    'dangling_start': "НачальнаяОпора не найдена в выгрузке",
+    'dangling_end': "КонечнаяОпора не найдена в выгрузке",
+    'orphan_span': "Участок пролета не найден в выгрузке",
+    'orphan_section': "ЛЭП участка не найдена в выгрузке",
+    'line_without_sections': "У ЛЭП нет участков",
+}
+
+REPORT_FIELDS = ('code', 'type', 'ref', 'name', 'detail')
+
+# Длины отрезков по формуле гаверсинусов (массивы в градусах, результат в метрах)
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = (np.radians(a) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+# Маска точек внутри области
+def in_region(lon, lat, region):
+    min_lon, min_lat, max_lon, max_lat = region
+    return (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+# Маска значений, которых нет среди allowed (строки сравниваются массивами NumPy)
+def not_in(values, allowed):
+    if not values:
+        return np.zeros(0, dtype=bool)
+    return ~np.isin(np.array(values, dtype=str), np.array(list(allowed), dtype=str))
+
+# Замечание отчёта по объекту
+def issue(code, obj_type, obj, detail=''):
+    return {'code': code, 'type': obj_type, 'ref': obj.ref, 'name': obj.name, 'detail': detail}
+
+# Проверки опор: отсутствие координат, перепутанные широта/долгота, выход
+# за область и совпадение координат нескольких опор
+def check_supports(store, region=DEFAULT_REGION):
+    lat = np.frombuffer(store.support_lat, dtype=np.float64)
+    lon = np.frombuffer(store.support_lon, dtype=np.float64)
+    issues = []
+    # Как в конвертере: нулевая координата считается отсутствующей
+    present = ~(np.isnan(lat) | np.isnan(lon) | (lat == 0) | (lon == 0))
+    for i in np.flatnonzero(~present):
+        issues.append(issue('missing_coordinates', 'pylons', store.supports[i]))
+
+    inside = in_region(lon, lat, region)
+    swapped = present & ~inside & in_region(lat, lon, region)
+    outside = present & ~inside & ~swapped
+    for i in np.flatnonzero(swapped):
+        issues.append(issue('swapped_coordinates', 'pylons', store.supports[i], f"{lat[i]}, {lon[i]}"))
+    for i in np.flatnonzero(outside):
+        issues.append(issue('out_of_region', 'pylons', store.supports[i], f"{lat[i]}, {lon[i]}"))
+
+    # Совпадающие координаты: сортировка по (широта, долгота) и поиск серий одинаковых
+    index = np.flatnonzero(present)
+    if len(index) > 1:
+        rounded_lat = np.round(lat[index], DUPLICATE_DECIMALS)
+        rounded_lon = np.round(lon[index], DUPLICATE_DECIMALS)
+        order = np.lexsort((rounded_lon, rounded_lat))
+        same = (rounded_lat[order][1:] == rounded_lat[order][:-1]) & (rounded_lon[order][1:] == rounded_lon[order][:-1])
+        run_start = np.flatnonzero(np.concatenate([[True], ~same]))
+        first_of_run = np.repeat(run_start, np.diff(np.append(run_start, len(order))))
+        for k in np.flatnonzero(np.concatenate([[False], same])):
+            first = store.supports[index[order[first_of_run[k]]]]
+            issues.append(issue('duplicate_coordinates', 'pylons', store.supports[index[order[k]]],
+                                f"как у опоры {first.ref}"))
+    return issues
+
+# Проверки пролетов: ссылки на опоры, которых нет в выгрузке, и длина пролета
+def check_spans(store, min_span_m=MIN_SPAN_M, max_span_m=MAX_SPAN_M):
+    start = np.frombuffer(store.span_start, dtype=np.int64)
+    end = np.frombuffer(store.span_end, dtype=np.int64)
+    issues = []
+    for i in np.flatnonzero(start < 0):
+        issues.append(issue('dangling_start', 'span', store.spans[i], store.spans[i].start or ''))
+    for i in np.flatnonzero(end < 0):
+        issues.append(issue('dangling_end', 'span', store.spans[i], store.spans[i].end or ''))
+
+    lat = np.frombuffer(store.support_lat, dtype=np.float64)
+    lon = np.frombuffer(store.support_lon, dtype=np.float64)
+    both = (start >= 0) & (end >= 0)
+    index = np.flatnonzero(both)
+    a, b = start[index], end[index]
+    measurable = ~(np.isnan(lat[a]) | np.isnan(lat[b]) | np.isnan(lon[a]) | np.isnan(lon[b]))
+    index, a, b = index[measurable], a[measurable], b[measurable]
+    length = haversine(lon[a], lat[a], lon[b], lat[b])
+    for k in np.flatnonzero(length < min_span_m):
+        issues.append(issue('short_span', 'span', store.spans[index[k]], f"{length[k]:.1f} м"))
+    for k in np.flatnonzero(length > max_span_m):
+        issues.append(issue('long_span', 'span', store.spans[index[k]], f"{length[k]:.1f} м"))
+    return issues
+
+# Проверки иерархии: пролеты и участки без родителя в выгрузке, ЛЭП без участков
+def check_hierarchy(store):
+    issues = []
+    section_refs = [s.ref for s in store.sections]
+    for i in np.flatnonzero(not_in([s.parent for s in store.spans], section_refs)):
+        issues.append(issue('orphan_span', 'span', store.spans[i], store.spans[i].parent))
+    line_guids = [line.guid or '' for line in store.lines]
+    for i in np.flatnonzero(not_in([s.parent for s in store.sections], line_guids)):
+        issues.append(issue('orphan_section', 'lines', store.sections[i], store.sections[i].parent))
+    for i in np.flatnonzero(not_in(line_guids, store.sections_by_line)):
+        issues.append(issue('line_without_sections', 'fulllines', store.lines[i], store.lines[i].guid or ''))
+    return issues
+
+# Все проверки хранилища; возвращает список замечаний
+def check_network(store, region=DEFAULT_REGION, min_span_m=MIN_SPAN_M, max_span_m=MAX_SPAN_M):
+    return check_supports(store, region) + check_spans(store, min_span_m, max_span_m) + check_hierarchy(store)
+
+# Число замечаний по кодам
+def summarize(issues):
+    summary = {}
+    for row in issues:
+        summary[row['code']] = summary.get(row['code'], 0) + 1
+    return summary
+
+# Запись отчёта: CSV для файлов .csv, иначе JSON со сводкой и списком замечаний
+def write_report(issues, report_file):
+    if report_file.endswith('.csv'):
+        with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, delimiter=';')
+            writer.writeheader()
+            writer.writerows(issues)
+    else:
+        summary = {code: {'title': ISSUE_TITLES.get(code, code), 'count': count}
+                   for code, count in summarize(issues).items()}
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'issues': issues}, f, ensure_ascii=False, indent=2)
+    logging.info("Отчёт проверки (%d замечаний) записан в '%s'", len(issues), report_file)
+
+# Проверка выгрузки с записью отчёта; возвращает сводку по кодам
+def validate_xml(input_file, report_file='validation_report.json', **options):
+    store = load_network(input_file)
+    if store is None:
+        return None
+    issues = check_network(store, **options)
+    write_report(issues, report_file)
+    return summarize(issues)
+
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'ЛЭП.xml'
+    report_file = sys.argv[2] if len(sys.argv) > 2 else 'validation_report.json'
+    print(validate_xml(input_file, report_file))
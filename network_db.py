@@ -0,0 +1,188 @@
+import logging
+import os
+import sqlite3
+import xml.etree.ElementTree as ET
+
+from final_xml_to_geojsonn import (
+    GUID_OPORA, GUID_PROLET, GUID_UCHASTOK, GUID_VL_LEP, NetworkObject, NetworkStore, iter_features,
+    iter_network_objects, parse_voltage_classes, validate_network,
+)
+from geojson_writer import open_geojson_writer
+
+# Локальный индекс структуры сети в SQLite: выгрузка разбирается один раз, а дальше
+# любые варианты выгрузки (один филиал, класс напряжения, одна ЛЭП) и поиск по Ref
+# выполняются запросами к базе с индексами, без повторного разбора XML.
+
+DEFAULT_DB = 'network.sqlite'
+BATCH_SIZE = 10000
+
+# Колонки таблицы objects в порядке полей NetworkObject
+OBJECT_COLUMNS = ('ref', 'parent', 'kind', 'start_ref', 'end_ref', 'guid', 'code', 'name',
+                  'filial', 'responsible', 'voltage_id', 'lat', 'lon')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    ref TEXT PRIMARY KEY,
+    parent TEXT,
+    kind TEXT,
+    start_ref TEXT,
+    end_ref TEXT,
+    guid TEXT,
+    code TEXT,
+    name TEXT,
+    filial TEXT,
+    responsible TEXT,
+    voltage_id TEXT,
+    lat REAL,
+    lon REAL,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS voltage_classes (
+    ref TEXT PRIMARY KEY,
+    name TEXT,
+    voltage REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Индексы создаются после массовой вставки — так импорт быстрее
+INDEXES = """
+CREATE INDEX IF NOT EXISTS objects_parent ON objects (parent);
+CREATE INDEX IF NOT EXISTS objects_guid ON objects (guid);
+CREATE INDEX IF NOT EXISTS objects_kind ON objects (kind);
+CREATE INDEX IF NOT EXISTS objects_filial ON objects (filial);
+CREATE INDEX IF NOT EXISTS objects_voltage ON objects (voltage_id);
+CREATE INDEX IF NOT EXISTS objects_seq ON objects (seq);
+"""
+
+def connect(db_file=DEFAULT_DB):
+    connection = sqlite3.connect(db_file)
+    connection.executescript(SCHEMA)
+    return connection
+
+# Импорт выгрузки и классов напряжения в базу (база пересоздаётся).
+# Повтор Ref, как и в конвертере, перезаписывает поля, сохраняя место первого вхождения
+def import_xml_to_db(input_file, voltage_file='Классы_напряжения.xml', db_file=DEFAULT_DB):
+    # Новая база строится рядом и заменяет старую только после успешного импорта
+    tmp_file = db_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    connection = connect(tmp_file)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    columns = ', '.join(OBJECT_COLUMNS)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in OBJECT_COLUMNS[1:])
+    insert = (f"INSERT INTO objects ({columns}, seq) VALUES ({', '.join('?' * (len(OBJECT_COLUMNS) + 1))}) "
+              f"ON CONFLICT (ref) DO UPDATE SET {updates}")
+    count = 0
+    imported = False
+    try:
+        with connection:
+            batch = []
+            for obj in iter_network_objects(input_file):
+                if not obj.ref:
+                    continue
+                batch.append(tuple(getattr(obj, field) for field in NetworkObject.__slots__) + (count,))
+                count += 1
+                if len(batch) >= BATCH_SIZE:
+                    connection.executemany(insert, batch)
+                    batch = []
+            connection.executemany(insert, batch)
+
+            voltage_classes = parse_voltage_classes(voltage_file)
+            connection.executemany("INSERT INTO voltage_classes VALUES (?, ?, ?)",
+                                   [(ref, vc['name'], vc['voltage']) for ref, vc in voltage_classes.items()])
+            connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                   [('input_file', os.path.abspath(input_file)),
+                                    ('voltage_file', os.path.abspath(voltage_file))])
+        connection.executescript(INDEXES)
+        imported = True
+    except FileNotFoundError:
+        logging.error("Файл '%s' не найден.", input_file)
+        return None
+    except ET.ParseError:
+        logging.error("Ошибка парсинга '%s'.", input_file)
+        return None
+    finally:
+        connection.close()
+        if not imported:
+            os.remove(tmp_file)
+    os.replace(tmp_file, db_file)
+    logging.info("Импортировано %d объектов из '%s' в '%s'", count, input_file, db_file)
+    return count
+
+# Классы напряжения из базы в том же виде, что parse_voltage_classes
+def load_voltage_classes(connection):
+    return {ref: {'name': name, 'voltage': voltage}
+            for ref, name, voltage in connection.execute("SELECT ref, name, voltage FROM voltage_classes")}
+
+# Поиск объекта по Ref или гуид (словарь полей или None)
+def lookup(connection, ref):
+    cursor = connection.execute(f"SELECT {', '.join(OBJECT_COLUMNS)} FROM objects WHERE ref = ? OR guid = ? "
+                                "ORDER BY seq LIMIT 1", (ref, ref))
+    row = cursor.fetchone()
+    return dict(zip(OBJECT_COLUMNS, row)) if row else None
+
+# Условие отбора объектов по фильтрам; пустое условие — вся сеть
+def selection_sql(filial=None, min_voltage=None, max_voltage=None, line=None):
+    conditions, params = [], []
+    if filial is not None:
+        conditions.append("filial = ?")
+        params.append(filial)
+    if min_voltage is not None or max_voltage is not None:
+        conditions.append("voltage_id IN (SELECT ref FROM voltage_classes WHERE voltage BETWEEN ? AND ?)")
+        params.extend([min_voltage if min_voltage is not None else float('-inf'),
+                       max_voltage if max_voltage is not None else float('inf')])
+    if line is not None:
+        # Поддерево одной ЛЭП (по Ref или гуид): ЛЭП -> участки -> пролеты
+        conditions.append(
+            "ref IN (WITH l AS (SELECT ref, guid FROM objects WHERE kind = ? AND (ref = ? OR guid = ?)),"
+            " s AS (SELECT ref FROM objects WHERE kind = ? AND parent IN (SELECT guid FROM l)),"
+            " p AS (SELECT ref FROM objects WHERE kind = ? AND parent IN (SELECT ref FROM s))"
+            " SELECT ref FROM l UNION ALL SELECT ref FROM s UNION ALL SELECT ref FROM p)")
+        params.extend([GUID_VL_LEP, line, line, GUID_UCHASTOK, GUID_PROLET])
+    return ' AND '.join(conditions), params
+
+# Объекты выборки в порядке выгрузки; опоры, на которые ссылаются выбранные
+# пролеты, добавляются всегда, чтобы relations пролетов разрешались
+def select_objects(connection, filial=None, min_voltage=None, max_voltage=None, line=None):
+    where, params = selection_sql(filial, min_voltage, max_voltage, line)
+    columns = ', '.join(OBJECT_COLUMNS)
+    if not where:
+        cursor = connection.execute(f"SELECT {columns} FROM objects ORDER BY seq")
+    else:
+        cursor = connection.execute(
+            f"WITH base AS (SELECT ref FROM objects WHERE {where}),"
+            " spans AS (SELECT start_ref, end_ref FROM objects WHERE kind = ? AND ref IN (SELECT ref FROM base))"
+            f" SELECT {columns} FROM objects WHERE ref IN (SELECT ref FROM base)"
+            " OR (kind = ? AND (ref IN (SELECT start_ref FROM spans) OR ref IN (SELECT end_ref FROM spans)))"
+            " ORDER BY seq", params + [GUID_PROLET, GUID_OPORA])
+    for row in cursor:
+        yield NetworkObject(*row)
+
+# Генерация GeoJSON прямо из базы с необязательными фильтрами
+def process_db_to_geojson(db_file=DEFAULT_DB, output_file='output.geojson', log_file='missing_coordinates.log',
+                          filial=None, min_voltage=None, max_voltage=None, line=None,
+                          output_format='geojson', compact=False, compress=None):
+    connection = sqlite3.connect(db_file)
+    try:
+        voltage_classes = load_voltage_classes(connection)
+        store = NetworkStore.from_objects(select_objects(connection, filial, min_voltage, max_voltage, line))
+    finally:
+        connection.close()
+    logging.info("Выбрано %d объектов из '%s'", store.object_count, db_file)
+    logging.info("Найдено %d ЛЭП, %d участков, %d пролетов, %d опор",
+                 len(store.lines), len(store.sections), len(store.spans), len(store.supports))
+    validate_network(store, log_file)
+    with open_geojson_writer(output_file, output_format, compact, compress) as writer:
+        for feature in iter_features(store, voltage_classes):
+            writer.write(feature)
+    logging.info("GeoJSON записан в '%s' с %d features", output_file, writer.count)
+    return writer.count
+
+if __name__ == "__main__":
+    import_xml_to_db('ЛЭП.xml')
+    process_db_to_geojson()
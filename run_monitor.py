@@ -0,0 +1,157 @@
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: пик памяти процесса недоступен без сторонних модулей
+    resource = None
+
+# Инструментирование конвейера: именованные этапы с временем, числом объектов и пиком
+# памяти, а также прогресс и отмена для GUI. Конвертер вызывает monitor.stage(...) и
+# monitor.advance(...); всё, что нужно вызывающему, — передать колбэк и/или Event отмены.
+
+# Этапы конвертера в порядке выполнения и их доля в общем прогрессе
+STAGE_WEIGHTS = {
+    'parse': 0.40,
+    'categorise': 0.05,
+    'parse_relations': 0.15,  # Второй проход по файлу при фильтре выборки; без него вес зачитывается skip()
+    'validate_supports': 0.01,
+    'validate_spans': 0.01,
+    'validate_sections': 0.01,
+    'validate_lines': 0.01,
+    'checks': 0.0,  # Отчёт проверки качества данных, только по запросу
+    'emit': 0.36,
+    'write': 0.0,  # Идёт вперемешку с emit, прогресс учитывается в нём
+}
+
+# Снимок прогресса для колбэка: этап, сделано/всего в единицах этапа, общая доля 0..1, ETA в секундах
+Progress = namedtuple('Progress', 'stage done total fraction eta')
+
+class RunCancelled(Exception):
+    pass
+
+class StageStats:
+    __slots__ = ('name', 'seconds', 'count', 'peak_mb', 'process_peak_mb')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.count = 0
+        self.peak_mb = None  # Пик памяти самого этапа (tracemalloc, только при trace_memory)
+        self.process_peak_mb = None  # Пик всего процесса с его запуска к концу этапа (ru_maxrss)
+
+class RunMonitor:
+    def __init__(self, progress=None, cancel_event=None, trace_memory=False, interval=0.2):
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.trace_memory = trace_memory
+        self.interval = interval
+        self.stats = {}
+        self.started = time.perf_counter()
+        self.current = None
+        self.done = 0
+        self.total = None
+        self.completed_weight = 0.0
+        self.last_notified = 0.0
+        self.ticks = 0
+        self.position = None
+
+    def _stats(self, name):
+        if name not in self.stats:
+            self.stats[name] = StageStats(name)
+        return self.stats[name]
+
+    # Выполнение этапа; total — объём этапа: по умолчанию в объектах, а если задан
+    # position (например, tell() входного файла) — в единицах, которые он возвращает
+    @contextmanager
+    def stage(self, name, total=None, position=None):
+        self.check_cancelled()
+        self.current, self.done, self.total, self.position = name, 0, total, position
+        stats = self._stats(name)
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            stats.seconds += time.perf_counter() - started
+            if self.trace_memory:
+                stats.peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            if resource is not None:
+                # ru_maxrss не сбрасывается: это пик процесса за всё время, а не этапа (Linux: КиБ, macOS: байты)
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                stats.process_peak_mb = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+        self.completed_weight += STAGE_WEIGHTS.get(name, 0.0)
+        self.current = self.position = None
+        self.done = total if total is not None else self.done
+        self._notify(stage=name)
+
+    # Этап, который в этом прогоне не нужен (например, дочитывание опор без фильтра):
+    # его вес сразу засчитывается, чтобы прогресс дошёл до конца
+    def skip(self, name):
+        self.completed_weight += STAGE_WEIGHTS.get(name, 0.0)
+        self._notify(stage=name)
+
+    # Учёт времени и объектов этапа, который идёт вперемешку с другим (emit/write)
+    def add_time(self, name, seconds, count=0):
+        stats = self._stats(name)
+        stats.seconds += seconds
+        stats.count += count
+
+    # Продвижение текущего этапа на count объектов. Проверка отмены и колбэк — не чаще interval
+    def advance(self, count=1):
+        if self.current is not None:
+            self.stats[self.current].count += count
+        self.done += count
+        self.ticks += 1
+        if self.ticks & 0xff:
+            return
+        now = time.perf_counter()
+        if now - self.last_notified >= self.interval:
+            self.check_cancelled()
+            self._notify(now)
+
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelled("Конвертация отменена пользователем")
+
+    # Общая доля выполнения по весам этапов
+    def fraction(self):
+        fraction = self.completed_weight
+        if self.current is not None and self.total:
+            fraction += STAGE_WEIGHTS.get(self.current, 0.0) * min(1.0, self.done / self.total)
+        return min(1.0, fraction)
+
+    def _notify(self, now=None, stage=None):
+        now = time.perf_counter() if now is None else now
+        self.last_notified = now
+        if self.position is not None:
+            self.done = self.position()
+        if self.progress is None:
+            return
+        fraction = self.fraction()
+        elapsed = now - self.started
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0.01 else None
+        self.progress(Progress(stage or self.current, self.done, self.total, fraction, eta))
+
+    # Таблица времени по этапам для лога
+    def format_report(self):
+        total = time.perf_counter() - self.started
+        lines = [f"{'Этап':<20}{'сек':>10}{'объектов':>12}{'пик МБ':>10}{'пик процесса МБ':>18}"]
+        for stats in self.stats.values():
+            peak = f"{stats.peak_mb:.1f}" if stats.peak_mb is not None else '-'
+            process_peak = f"{stats.process_peak_mb:.1f}" if stats.process_peak_mb is not None else '-'
+            lines.append(f"{stats.name:<20}{stats.seconds:>10.3f}{stats.count:>12}{peak:>10}{process_peak:>18}")
+        lines.append(f"{'всего':<20}{total:>10.3f}")
+        return '\n'.join(lines)
+
+    # Отчёт в виде списка словарей (для сохранения в JSON)
+    def report(self):
+        return [{'stage': s.name, 'seconds': round(s.seconds, 4), 'count': s.count,
+                 'peak_mb': round(s.peak_mb, 2) if s.peak_mb is not None else None,
+                 'process_peak_mb': round(s.process_peak_mb, 2) if s.process_peak_mb is not None else None}
+                for s in self.stats.values()]
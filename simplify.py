@@ -0,0 +1,214 @@
+import json
+import logging
+import math
+
+import numpy as np
+
+from geojson_writer import open_geojson_writer
+
+# Генерализация геометрии по уровням детализации: квантование координат и упрощение
+# линий (Дуглас — Пекер или Висвалингам — Уайатт). Все линии пачки склеиваются в один
+# массив точек со смещениями, и каждый шаг алгоритма выполняется сразу для всех
+# линий операциями NumPy, без циклов Python по точкам.
+# Модуль требует numpy (pip install numpy); основной конвертер от него не зависит.
+
+TILE_SIZE = 256  # Размер тайла в пикселях для перевода зума в градусы
+CHUNK_SIZE = 20000  # Сколько features обрабатывать одной пачкой
+
+# Размер пикселя в градусах долготы на зуме z
+def degrees_per_pixel(zoom):
+    return 360.0 / (TILE_SIZE * (1 << zoom))
+
+# Число знаков после запятой, достаточное для зума (точность ~ пиксель)
+def precision_for_zoom(zoom):
+    return max(0, math.ceil(-math.log10(degrees_per_pixel(zoom))))
+
+# Склейка линий в массив точек (N, 2) и массив смещений начала каждой линии (L + 1)
+def pack_lines(lines):
+    lengths = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.array([point for line in lines for point in line], dtype=np.float64).reshape(-1, 2)
+    return points, offsets
+
+# Разбиение массива точек обратно на линии по маске оставляемых точек
+def unpack_lines(points, offsets, keep):
+    kept_before = np.zeros(len(points) + 1, dtype=np.int64)
+    np.cumsum(keep, out=kept_before[1:])
+    kept_offsets = kept_before[offsets]
+    kept = points[keep].tolist()
+    return [kept[kept_offsets[i]:kept_offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+# Номер линии для каждой точки
+def line_ids(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+# Маска концевых точек линий (их упрощение никогда не удаляет)
+def endpoint_mask(offsets, size):
+    keep = np.zeros(size, dtype=bool)
+    nonempty = offsets[1:] > offsets[:-1]
+    keep[offsets[:-1][nonempty]] = True
+    keep[offsets[1:][nonempty] - 1] = True
+    return keep
+
+# Дуглас — Пекер для всех линий сразу: на каждой итерации для всех активных диапазонов
+# одновременно ищется самая удалённая от хорды точка, диапазоны с отклонением больше
+# tolerance делятся в ней пополам
+def douglas_peucker_mask(points, offsets, tolerance):
+    keep = endpoint_mask(offsets, len(points))
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    active = ends - starts > 1
+    starts, ends = starts[active], ends[active]
+    while len(starts):
+        counts = ends - starts - 1
+        range_ids = np.repeat(np.arange(len(starts)), counts)
+        first = np.zeros(len(starts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=first[1:])
+        index = starts[range_ids] + 1 + (np.arange(len(range_ids)) - first[range_ids])
+
+        a, b, p = points[starts[range_ids]], points[ends[range_ids]], points[index]
+        chord = b - a
+        chord_length = np.hypot(chord[:, 0], chord[:, 1])
+        cross = np.abs(chord[:, 0] * (p[:, 1] - a[:, 1]) - chord[:, 1] * (p[:, 0] - a[:, 0]))
+        distance = np.where(chord_length > 0, cross / np.where(chord_length > 0, chord_length, 1.0),
+                            np.hypot(p[:, 0] - a[:, 0], p[:, 1] - a[:, 1]))
+
+        max_distance = np.maximum.reduceat(distance, first)
+        is_max = distance == max_distance[range_ids]
+        _, first_max = np.unique(range_ids[is_max], return_index=True)
+        pivots = index[is_max][first_max]
+
+        split = max_distance > tolerance
+        keep[pivots[split]] = True
+        new_starts = np.concatenate([starts[split], pivots[split]])
+        new_ends = np.concatenate([pivots[split], ends[split]])
+        active = new_ends - new_starts > 1
+        starts, ends = new_starts[active], new_ends[active]
+    return keep
+
+# Висвалингам — Уайатт для всех линий сразу: на каждой итерации удаляются все
+# внутренние точки с площадью треугольника меньше min_area, являющиеся локальными
+# минимумами среди соседей (параллельный вариант последовательного алгоритма)
+def visvalingam_mask(points, offsets, min_area):
+    alive = np.ones(len(points), dtype=bool)
+    ids = line_ids(offsets)
+    keep_ends = endpoint_mask(offsets, len(points))
+    while True:
+        index = np.flatnonzero(alive)
+        if len(index) < 3:
+            break
+        prev_index, next_index = index[:-2], index[2:]
+        middle = index[1:-1]
+        interior = (ids[prev_index] == ids[middle]) & (ids[next_index] == ids[middle]) & ~keep_ends[middle]
+        a, p, b = points[prev_index], points[middle], points[next_index]
+        area = 0.5 * np.abs((p[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]) - (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]))
+        area = np.where(interior, area, np.inf)
+        left = np.concatenate([[np.inf], area[:-1]])
+        right = np.concatenate([area[1:], [np.inf]])
+        remove = (area < min_area) & (area <= left) & (area < right)
+        if not remove.any():
+            break
+        alive[middle[remove]] = False
+    return alive
+
+# Квантование координат и удаление повторяющихся подряд точек внутри линии
+def quantize(points, offsets, decimals):
+    points = np.round(points, decimals)
+    keep = np.ones(len(points), dtype=bool)
+    if len(points) > 1:
+        same = np.all(points[1:] == points[:-1], axis=1) & (line_ids(offsets)[1:] == line_ids(offsets)[:-1])
+        keep[1:] = ~same
+    return points, keep
+
+# Упрощение и квантование списка линий; линия, схлопнувшаяся в точку, даёт []
+def simplify_lines(lines, tolerance, decimals=None, method='dp'):
+    if not lines:
+        return []
+    points, offsets = pack_lines(lines)
+    if decimals is not None:
+        points, unique = quantize(points, offsets, decimals)
+        lines = unpack_lines(points, offsets, unique)
+        points, offsets = pack_lines(lines)
+    if method == 'dp':
+        keep = douglas_peucker_mask(points, offsets, tolerance)
+    elif method == 'vw':
+        keep = visvalingam_mask(points, offsets, tolerance * tolerance)
+    else:
+        raise ValueError(f"Неизвестный метод упрощения: {method}")
+    return [line if len(line) > 1 else [] for line in unpack_lines(points, offsets, keep)]
+
+# Упрощение пачки features для одного зума: все линии и точки пачки обрабатываются одним вызовом
+def simplify_feature_chunk(features, zoom, method='dp', pixel_tolerance=1.0):
+    tolerance = degrees_per_pixel(zoom) * pixel_tolerance
+    decimals = precision_for_zoom(zoom)
+    lines, owners = [], []
+    for n, feature in enumerate(features):
+        geometry = feature.get('geometry')
+        if geometry is None:
+            continue
+        if geometry['type'] == 'Point':
+            lines.append([geometry['coordinates']])
+            owners.append(n)
+        elif geometry['type'] == 'LineString':
+            lines.append(geometry['coordinates'])
+            owners.append(n)
+        elif geometry['type'] == 'MultiLineString':
+            lines.extend(geometry['coordinates'])
+            owners.extend([n] * len(geometry['coordinates']))
+    simplified = simplify_lines(lines, tolerance, decimals, method)
+
+    parts = {}
+    for n, line, original in zip(owners, simplified, lines):
+        if len(original) == 1:
+            # Точка: квантуется, но не упрощается
+            line = [[round(original[0][0], decimals), round(original[0][1], decimals)]]
+        if line:
+            parts.setdefault(n, []).append(line)
+
+    result = []
+    for n, feature in enumerate(features):
+        geometry = feature.get('geometry')
+        if geometry is not None:
+            feature = dict(feature)
+            lines_of_feature = parts.get(n)
+            if not lines_of_feature:
+                feature['geometry'] = None
+            elif geometry['type'] == 'Point':
+                feature['geometry'] = {"type": "Point", "coordinates": lines_of_feature[0][0]}
+            elif len(lines_of_feature) == 1 and geometry['type'] == 'LineString':
+                feature['geometry'] = {"type": "LineString", "coordinates": lines_of_feature[0]}
+            else:
+                feature['geometry'] = {"type": "MultiLineString", "coordinates": lines_of_feature}
+        result.append(feature)
+    return result
+
+# Генератор упрощённых features для зума; features обрабатываются пачками по CHUNK_SIZE
+def simplify_features(features, zoom, method='dp', pixel_tolerance=1.0):
+    chunk = []
+    for feature in features:
+        chunk.append(feature)
+        if len(chunk) >= CHUNK_SIZE:
+            yield from simplify_feature_chunk(chunk, zoom, method, pixel_tolerance)
+            chunk = []
+    if chunk:
+        yield from simplify_feature_chunk(chunk, zoom, method, pixel_tolerance)
+
+# Постобработка результата process_xml_to_geojson: по файлу на каждый зум
+# (output.z6.geojson и т.д.). Возвращает список записанных файлов
+def write_levels_of_detail(geojson_file, zooms=(6, 9, 12), method='dp', pixel_tolerance=1.0, compact=True):
+    with open(geojson_file, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    base = geojson_file[:-len('.geojson')] if geojson_file.endswith('.geojson') else geojson_file
+    written = []
+    for zoom in zooms:
+        output_file = f"{base}.z{zoom}.geojson"
+        with open_geojson_writer(output_file, compact=compact) as writer:
+            for feature in simplify_features(features, zoom, method, pixel_tolerance):
+                writer.write(feature)
+        logging.info("Уровень детализации z%d (%d знаков) записан в '%s'",
+                     zoom, precision_for_zoom(zoom), output_file)
+        written.append(output_file)
+    return written
+
+if __name__ == "__main__":
+    write_levels_of_detail('output.geojson')
@@ -0,0 +1,121 @@
+import random
+import sys
+from xml.sax.saxutils import escape
+
+from final_xml_to_geojsonn import GUID_LAT, GUID_LON, GUID_OPORA, GUID_PROLET, GUID_UCHASTOK, GUID_VL_LEP, NULL_REF
+
+# Генератор синтетических выгрузок 1С той же структуры, что ЛЭП.xml:
+# ЛЭП -> участки (Parent = гуид ЛЭП) -> пролеты (Parent = Ref участка) -> опоры.
+# Файл пишется потоково, поэтому можно генерировать выгрузки на миллионы объектов.
+
+XML_HEADER = ('\ufeff<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<V8Exch:_1CV8DtUD xmlns:V8Exch="http://www.1c.ru/V8/1CV8DtUD/" '
+              'xmlns:v8="http://v8.1c.ru/data" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+              '\t<V8Exch:Data>\n')
+XML_FOOTER = '\t</V8Exch:Data>\n</V8Exch:_1CV8DtUD>\n'
+
+# Классы напряжения синтетической сети: (Ref, Description, Значение)
+VOLTAGE_CLASSES = (
+    ('5b2a6a11-0000-4000-8000-000000000010', '10 кВ', '10'),
+    ('5b2a6a11-0000-4000-8000-000000000035', '35 кВ', '35'),
+    ('5b2a6a11-0000-4000-8000-000000000110', '110 кВ', '110'),
+    ('5b2a6a11-0000-4000-8000-000000000220', '220 кВ', '220'),
+)
+
+# Детерминированный GUID по порядковому номеру
+def make_ref(prefix, number):
+    return f"{prefix:08x}-{(number >> 48) & 0xffff:04x}-4{(number >> 36) & 0xfff:03x}-8000-{number & 0xffffffffffff:012x}"
+
+# Один объект CatalogObject.урскСтруктураСети
+def object_xml(ref, kind, parent, name, code, filial, voltage_id, extra=''):
+    return (f"\t\t<CatalogObject.урскСтруктураСети>\n"
+            f"\t\t\t<Ref>{ref}</Ref>\n"
+            f"\t\t\t<DeletionMark>false</DeletionMark>\n"
+            f"\t\t\t<Parent>{parent}</Parent>\n"
+            f"\t\t\t<Description>{escape(name)}</Description>\n"
+            f"\t\t\t<КодОбъекта>{code}</КодОбъекта>\n"
+            f"\t\t\t<Филиал>{filial}</Филиал>\n"
+            f"\t\t\t<Ответственный>{NULL_REF}</Ответственный>\n"
+            f"\t\t\t<КлассНапряжения>{voltage_id}</КлассНапряжения>\n"
+            f"\t\t\t<ВидТехническогоМеста>{kind}</ВидТехническогоМеста>\n"
+            f"{extra}"
+            f"\t\t</CatalogObject.урскСтруктураСети>\n")
+
+# Статические характеристики опоры с координатами (или пустые)
+def coordinates_xml(lat, lon):
+    if lat is None:
+        return "\t\t\t<СтатическиеХарактеристики/>\n"
+    return ("\t\t\t<СтатическиеХарактеристики>\n"
+            f"\t\t\t\t<Row>\n\t\t\t\t\t<Характеристика>{GUID_LAT}</Характеристика>\n"
+            f"\t\t\t\t\t<Значение>N{lat:.8f}</Значение>\n\t\t\t\t</Row>\n"
+            f"\t\t\t\t<Row>\n\t\t\t\t\t<Характеристика>{GUID_LON}</Характеристика>\n"
+            f"\t\t\t\t\t<Значение>E{lon:.8f}</Значение>\n\t\t\t\t</Row>\n"
+            "\t\t\t</СтатическиеХарактеристики>\n")
+
+# Запись синтетической выгрузки примерно из objects объектов.
+# missing_share — доля опор без координат; пролеты пишутся раньше своих опор,
+# чтобы конвертер разрешал ссылки вперёд, как в реальных выгрузках.
+# Возвращает число объектов каждого вида
+def write_synthetic_export(output_file, objects=10000, missing_share=0.05, filials=4, seed=1,
+                           sections_per_line=(1, 4), supports_per_section=(5, 40)):
+    rnd = random.Random(seed)
+    filial_refs = [make_ref(0x354cfc00, n) for n in range(filials)]
+    counts = {'lines': 0, 'sections': 0, 'spans': 0, 'supports': 0}
+    number = 0
+
+    def next_ref():
+        nonlocal number
+        number += 1
+        return make_ref(0x9a446800, number)
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(XML_HEADER)
+        written = 0
+        while written < objects:
+            line_no = counts['lines'] + 1
+            filial = rnd.choice(filial_refs)
+            voltage_id = rnd.choice(VOLTAGE_CLASSES)[0]
+            line_ref, line_guid = next_ref(), next_ref()
+            f.write(object_xml(line_ref, GUID_VL_LEP, NULL_REF, f"ВЛ Линия-{line_no}", f"VL110-{line_no:06d}",
+                               filial, voltage_id, f"\t\t\t<гуид>{line_guid}</гуид>\n"))
+            counts['lines'] += 1
+            written += 1
+            lat, lon = rnd.uniform(51.0, 56.0), rnd.uniform(43.0, 52.0)
+            for section_no in range(1, rnd.randint(*sections_per_line) + 1):
+                section_ref = next_ref()
+                f.write(object_xml(section_ref, GUID_UCHASTOK, line_guid, f"Участок {section_no}",
+                                   f"VL110-{line_no:06d}-{section_no:03d}", filial, voltage_id))
+                support_refs = [next_ref() for _ in range(rnd.randint(*supports_per_section))]
+                for span_no, (start, end) in enumerate(zip(support_refs, support_refs[1:]), 1):
+                    f.write(object_xml(next_ref(), GUID_PROLET, section_ref, f"Пролет {span_no}-{span_no + 1}",
+                                       f"VL110-{line_no:06d}-{section_no:03d}-P{span_no:04d}", filial, voltage_id,
+                                       f"\t\t\t<НачальнаяОпора>{start}</НачальнаяОпора>\n"
+                                       f"\t\t\t<КонечнаяОпора>{end}</КонечнаяОпора>\n"))
+                for support_no, support_ref in enumerate(support_refs, 1):
+                    lat += rnd.uniform(-0.002, 0.004)
+                    lon += rnd.uniform(-0.002, 0.004)
+                    missing = rnd.random() < missing_share
+                    f.write(object_xml(support_ref, GUID_OPORA, section_ref, f"Опора №{support_no}",
+                                       f"VL110-{line_no:06d}-{section_no:03d}-{support_no:04d}", filial, voltage_id,
+                                       coordinates_xml(None if missing else lat, lon)))
+                counts['sections'] += 1
+                counts['spans'] += len(support_refs) - 1
+                counts['supports'] += len(support_refs)
+                written += 1 + 2 * len(support_refs) - 1
+        f.write(XML_FOOTER)
+    return counts
+
+# Запись файла классов напряжения, соответствующего синтетической выгрузке
+def write_voltage_classes(output_file):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(XML_HEADER)
+        for ref, name, value in VOLTAGE_CLASSES:
+            f.write(f"\t\t<CatalogObject.урскКлассыНапряжений>\n\t\t\t<Ref>{ref}</Ref>\n"
+                    f"\t\t\t<DeletionMark>false</DeletionMark>\n\t\t\t<Description>{name}</Description>\n"
+                    f"\t\t\t<Значение>{value}</Значение>\n\t\t</CatalogObject.урскКлассыНапряжений>\n")
+        f.write(XML_FOOTER)
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(write_synthetic_export(f'synthetic_{size}.xml', size))
+    write_voltage_classes('synthetic_Классы_напряжения.xml')
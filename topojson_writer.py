@@ -0,0 +1,109 @@
+import json
+import logging
+
+from final_xml_to_geojsonn import FEATURE_BUILDERS, iter_feature_order
+from geojson_writer import open_text_sink, replace_on_success
+from line_topology import chain_paths
+
+# Запись сети в TopoJSON: опоры — общие вершины, каждый валидный пролет — дуга
+# из двух вершин, участки и ЛЭП ссылаются на дуги своих пролетов (~k — дуга в
+# обратном направлении). Координаты квантуются на сетку transform, дуги кодируются
+# приращениями, поэтому каждая координата опоры пишется один раз в виде целых чисел.
+
+DEFAULT_QUANTIZATION = 1000000  # Узлов сетки по каждой оси (~1 м на области в 10°)
+
+# Параметры квантования по охвату валидных опор: (bbox, scale, translate)
+def topology_transform(store, quantization=DEFAULT_QUANTIZATION):
+    lons = [lon for lon, valid in zip(store.support_lon, store.support_valid) if valid]
+    lats = [lat for lat, valid in zip(store.support_lat, store.support_valid) if valid]
+    if not lons:
+        return None, [1.0, 1.0], [0.0, 0.0]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+    scale = [(bbox[2] - bbox[0]) / (quantization - 1) or 1.0, (bbox[3] - bbox[1]) / (quantization - 1) or 1.0]
+    return bbox, scale, [bbox[0], bbox[1]]
+
+# Дуги цепочек участка: для каждой цепочки — номера дуг её пролетов по порядку обхода
+def section_arcs(store, section_ref, arc_index):
+    spans = store.valid_spans_of(section_ref)
+    edges = [(store.span_start[j], store.span_end[j]) for j in spans]
+    return [[arc_index[spans[step]] if step >= 0 else ~arc_index[spans[~step]] for step in steps]
+            for _, steps in chain_paths(edges)]
+
+# Геометрия из списка цепочек дуг (None, LineString или MultiLineString);
+# multi — всегда MultiLineString, как у ЛЭП в GeoJSON
+def arcs_geometry(chains, multi=False):
+    if not chains:
+        return {"type": None}
+    if len(chains) == 1 and not multi:
+        return {"type": "LineString", "arcs": chains[0]}
+    return {"type": "MultiLineString", "arcs": chains}
+
+# Объект геометрии TopoJSON из feature: те же properties, relations и warning,
+# а вместо координат — квантованная точка или ссылки на дуги
+def topology_object(feature, geometry):
+    obj = dict(geometry)
+    obj["id"] = feature["properties"]["ref"]
+    obj["properties"] = feature["properties"]
+    for key in ("system", "warning"):
+        if key in feature:
+            obj[key] = feature[key]
+    return obj
+
+# Запись провалидированного хранилища в TopoJSON; monitor (RunMonitor) продвигается
+# на каждый объект, output_file заменяется только готовым файлом (см. replace_on_success).
+# Возвращает число объектов
+def write_topojson(store, voltage_classes, output_file, quantization=DEFAULT_QUANTIZATION, compress=None,
+                   monitor=None):
+    order = {kind: [] for kind in FEATURE_BUILDERS}
+    for kind, i in iter_feature_order(store):
+        order[kind].append(i)
+    arc_index = {span: k for k, span in enumerate(order['span'])}
+    bbox, scale, translate = topology_transform(store, quantization)
+
+    def quantize(index):
+        return [round((store.support_lon[index] - translate[0]) / scale[0]),
+                round((store.support_lat[index] - translate[1]) / scale[1])]
+
+    # Координаты и дуги строятся отдельно, features — только ради properties и relations
+    assemble_geometry = store.assemble_geometry
+    store.assemble_geometry = False
+    if compress is None:
+        compress = str(output_file).endswith('.gz')
+    count = 0
+    try:
+        with replace_on_success(output_file) as partial_file, open_text_sink(partial_file, compress) as f:
+            header = {"type": "Topology", "transform": {"scale": scale, "translate": translate}}
+            if bbox is not None:
+                header["bbox"] = bbox
+            f.write(json.dumps(header, ensure_ascii=False, separators=(',', ':'))[:-1] + ',"objects":{')
+            for n, (kind, indexes) in enumerate(order.items()):
+                f.write(f'{"," if n else ""}"{kind}":{{"type":"GeometryCollection","geometries":[')
+                for k, i in enumerate(indexes):
+                    feature = FEATURE_BUILDERS[kind](store, i, voltage_classes)
+                    if kind == 'pylons':
+                        geometry = {"type": "Point", "coordinates": quantize(i)} if store.support_valid[i] else {"type": None}
+                    elif kind == 'span':
+                        geometry = {"type": "LineString", "arcs": [k]}
+                    elif kind == 'lines':
+                        geometry = arcs_geometry(section_arcs(store, store.sections[i].ref, arc_index))
+                    else:
+                        geometry = arcs_geometry([chain for j in store.valid_sections_of(store.lines[i])
+                                                  for chain in section_arcs(store, store.sections[j].ref, arc_index)],
+                                                 multi=True)
+                    if k:
+                        f.write(',')
+                    f.write(json.dumps(topology_object(feature, geometry), ensure_ascii=False, separators=(',', ':')))
+                    count += 1
+                    if monitor is not None:
+                        monitor.advance()
+                f.write(']}')
+            f.write('},"arcs":[')
+            for k, i in enumerate(order['span']):
+                a = quantize(store.span_start[i])
+                b = quantize(store.span_end[i])
+                f.write(f"{',' if k else ''}[[{a[0]},{a[1]}],[{b[0] - a[0]},{b[1] - a[1]}]]")
+            f.write(']}')
+    finally:
+        store.assemble_geometry = assemble_geometry
+    logging.info("TopoJSON записан в '%s': %d объектов, %d дуг", output_file, count, len(order['span']))
+    return count
@@ -0,0 +1,227 @@
+import json
+import logging
+import math
+import os
+from collections import defaultdict
+
+from final_xml_to_geojsonn import iter_features, load_network, parse_voltage_classes, validate_network
+
+# Нарезка features на статическую пирамиду тайлов z/x/y (Web Mercator, как у XYZ-слоёв
+# Leaflet/OpenLayers). Опоры и отрезки линий раскладываются по сеточному индексу
+# на максимальном зуме; тайлы меньших зумов собираются из ячеек этого индекса,
+# поэтому каждый уровень обрабатывается за время, пропорциональное числу объектов.
+
+# Минимальный зум, с которого тип объекта попадает в тайлы
+DEFAULT_ZOOM_RULES = {
+    'fulllines': 0,
+    'lines': 8,
+    'span': 11,
+    'pylons': 13,
+}
+
+# Минимальное напряжение (кВ) по зумам: (с какого зума, порог); None — напряжение неизвестно, объект берётся
+DEFAULT_VOLTAGE_RULES = ((0, 220.0), (6, 110.0), (9, 0.0))
+
+TILE_BUFFER = 1 / 64  # Запас отсечения вокруг тайла в долях его размера
+MAX_LATITUDE = 85.0511287798
+
+# Долгота/широта -> дробные координаты тайла на зуме z
+def lonlat_to_tile(lon, lat, z):
+    n = 1 << z
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+# Границы тайла в градусах: (min_lon, min_lat, max_lon, max_lat)
+def tile_bounds(z, x, y):
+    n = 1 << z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lon, min_lat, max_lon, max_lat
+
+# Список линий (списков точек) геометрии; точка — линия из одной вершины
+def geometry_parts(geometry):
+    kind = geometry['type']
+    if kind == 'Point':
+        return [[geometry['coordinates']]]
+    if kind == 'LineString':
+        return [geometry['coordinates']]
+    if kind == 'MultiLineString':
+        return geometry['coordinates']
+    return []
+
+# Отсечение отрезка прямоугольником (Лян — Барски); None, если отрезок снаружи
+def clip_segment(p, q, bounds):
+    min_x, min_y, max_x, max_y = bounds
+    x0, y0 = p
+    dx, dy = q[0] - x0, q[1] - y0
+    t0, t1 = 0.0, 1.0
+    for edge_p, edge_q in ((-dx, x0 - min_x), (dx, max_x - x0), (-dy, y0 - min_y), (dy, max_y - y0)):
+        if edge_p == 0:
+            if edge_q < 0:
+                return None
+        else:
+            t = edge_q / edge_p
+            if edge_p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+    start = [x0 + t0 * dx, y0 + t0 * dy] if t0 > 0 else p
+    end = [x0 + t1 * dx, y0 + t1 * dy] if t1 < 1 else q
+    return start, end
+
+# Отсечение ломаной: внутри прямоугольника остаются одна или несколько частей
+def clip_line(line, bounds):
+    parts = []
+    current = None
+    for p, q in zip(line, line[1:]):
+        clipped = clip_segment(p, q, bounds)
+        if clipped is None:
+            current = None
+            continue
+        start, end = clipped
+        if current is None or current[-1] is not p or start is not p:
+            current = [start]
+            parts.append(current)
+        current.append(end)
+    return parts
+
+# Отсечение геометрии feature по прямоугольнику; None, если внутри ничего не осталось
+def clip_geometry(geometry, bounds):
+    if geometry['type'] == 'Point':
+        lon, lat = geometry['coordinates']
+        inside = bounds[0] <= lon <= bounds[2] and bounds[1] <= lat <= bounds[3]
+        return geometry if inside else None
+    parts = []
+    for line in geometry_parts(geometry):
+        parts.extend(clip_line(line, bounds))
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return {"type": "LineString", "coordinates": parts[0]}
+    return {"type": "MultiLineString", "coordinates": parts}
+
+# Сеточный индекс на зуме index_zoom: ячейка (x, y) -> номера объектов.
+# Опора попадает в одну ячейку, каждый отрезок линии — в ячейки своего охвата
+class TileGridIndex:
+    def __init__(self, index_zoom):
+        self.zoom = index_zoom
+        self.cells = defaultdict(list)
+
+    def insert(self, item, geometry):
+        z = self.zoom
+        cells = set()
+        for line in geometry_parts(geometry):
+            points = [lonlat_to_tile(lon, lat, z) for lon, lat in line]
+            if len(points) == 1:
+                cells.add((int(points[0][0]), int(points[0][1])))
+                continue
+            for (x0, y0), (x1, y1) in zip(points, points[1:]):
+                for x in range(int(min(x0, x1)), int(max(x0, x1)) + 1):
+                    for y in range(int(min(y0, y1)), int(max(y0, y1)) + 1):
+                        cells.add((x, y))
+        for cell in cells:
+            self.cells[cell].append(item)
+
+    # Тайлы зума z (z <= zoom индекса) с номерами объектов внутри
+    def tiles(self, z):
+        shift = self.zoom - z
+        tiles = defaultdict(set)
+        for (x, y), items in self.cells.items():
+            tiles[(x >> shift, y >> shift)].update(items)
+        return tiles
+
+# Минимальное напряжение для зума по правилам voltage_rules
+def voltage_threshold(z, voltage_rules):
+    threshold = 0.0
+    for from_zoom, min_voltage in voltage_rules:
+        if z >= from_zoom:
+            threshold = min_voltage
+    return threshold
+
+# Попадает ли объект в тайлы зума z по типу и напряжению
+def visible_at(properties, z, zoom_rules, voltage_rules):
+    min_zoom = zoom_rules.get(properties.get('type'))
+    if min_zoom is None or z < min_zoom:
+        return False
+    voltage = properties.get('voltage')
+    return voltage is None or voltage >= voltage_threshold(z, voltage_rules)
+
+# Запись пирамиды тайлов output_dir/z/x/y.geojson и описания tiles.json.
+# Возвращает число записанных тайлов
+def write_tile_pyramid(features, output_dir='tiles', min_zoom=0, max_zoom=14,
+                       zoom_rules=DEFAULT_ZOOM_RULES, voltage_rules=DEFAULT_VOLTAGE_RULES):
+    index = TileGridIndex(max_zoom)
+    items = []  # (свойства, JSON свойств, геометрия)
+    bounds = [180.0, 90.0, -180.0, -90.0]
+    for feature in features:
+        geometry = feature.get('geometry')
+        properties = feature['properties']
+        if geometry is None or properties.get('type') not in zoom_rules:
+            continue
+        index.insert(len(items), geometry)
+        items.append((properties, json.dumps(properties, ensure_ascii=False, separators=(',', ':')), geometry))
+        for line in geometry_parts(geometry):
+            for lon, lat in line:
+                bounds = [min(bounds[0], lon), min(bounds[1], lat), max(bounds[2], lon), max(bounds[3], lat)]
+    logging.info("В индекс тайлов добавлено %d объектов в %d ячейках", len(items), len(index.cells))
+
+    tile_count = 0
+    for z in range(min_zoom, max_zoom + 1):
+        visible = [visible_at(properties, z, zoom_rules, voltage_rules) for properties, _, _ in items]
+        zoom_tiles = 0
+        for (x, y), members in sorted(index.tiles(z).items()):
+            min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+            pad_lon, pad_lat = (max_lon - min_lon) * TILE_BUFFER, (max_lat - min_lat) * TILE_BUFFER
+            clip_bounds = (min_lon - pad_lon, min_lat - pad_lat, max_lon + pad_lon, max_lat + pad_lat)
+            fragments = []
+            for item in sorted(members):
+                if not visible[item]:
+                    continue
+                clipped = clip_geometry(items[item][2], clip_bounds)
+                if clipped is not None:
+                    fragments.append('{"type":"Feature","properties":%s,"geometry":%s}'
+                                     % (items[item][1], json.dumps(clipped, separators=(',', ':'))))
+            if not fragments:
+                continue
+            tile_dir = os.path.join(output_dir, str(z), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f"{y}.geojson"), 'w', encoding='utf-8') as f:
+                f.write('{"type":"FeatureCollection","features":[' + ','.join(fragments) + ']}')
+            zoom_tiles += 1
+        logging.info("Зум %d: записано %d тайлов", z, zoom_tiles)
+        tile_count += zoom_tiles
+
+    # Описание набора тайлов в духе TileJSON для клиента
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'tiles.json'), 'w', encoding='utf-8') as f:
+        json.dump({"tilejson": "3.0.0", "tiles": ["{z}/{x}/{y}.geojson"], "minzoom": min_zoom,
+                   "maxzoom": max_zoom, "bounds": bounds if items else None}, f, ensure_ascii=False, indent=2)
+    logging.info("Пирамида тайлов записана в '%s': %d тайлов", output_dir, tile_count)
+    return tile_count
+
+# Нарезка уже сгенерированного GeoJSON (FeatureCollection)
+def tile_geojson_file(geojson_file, output_dir='tiles', **options):
+    with open(geojson_file, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    return write_tile_pyramid(features, output_dir, **options)
+
+# Конвертация выгрузки сразу в пирамиду тайлов, минуя общий GeoJSON
+def process_xml_to_tiles(input_file, voltage_file='Классы_напряжения.xml', output_dir='tiles',
+                         log_file='missing_coordinates.log', **options):
+    voltage_classes = parse_voltage_classes(voltage_file)
+    store = load_network(input_file)
+    if store is None:
+        return 0
+    validate_network(store, log_file)
+    return write_tile_pyramid(iter_features(store, voltage_classes), output_dir, **options)
+
+if __name__ == "__main__":
+    process_xml_to_tiles('ЛЭП.xml')